@@ -105,10 +105,21 @@ ASGI_APPLICATION = 'MechOnGO.asgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite takes its write lock when a transaction begins (IMMEDIATE) and
+# writers wait up to `timeout` seconds for it, so concurrent claims queue up
+# instead of failing with "database is locked". Tests use a file too: the
+# in-memory test database uses shared-cache locking, which never waits.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -121,6 +132,23 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Process-local cache. Multi-worker deployments should switch this to
+# django.core.cache.backends.redis.RedisCache on the channel layer's Redis so
+# shared state (e.g. last known mechanic positions) is visible to every worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by every worker, on the channel layer's Redis. Used where a
+    # per-process cache would be wrong (see main/sharedcache.py), e.g. live
+    # positions and rate limit buckets.
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+        'KEY_PREFIX': 'mechongo',
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -167,6 +195,87 @@ STATICFILES_DIRS = [
 
 NOMINATIM_USER_AGENT = 'MechOnGO/1.0 (animatedcartoon5tamil@gmail.com)'
 
+# Geocoding of ServiceRequest.location (see main/geocoding.py). Set the provider
+# to 'main.geocoding.FixtureProvider' and GEOCODING_FIXTURES to a JSON file of
+# {"address": [lat, lng]} to work offline.
+GEOCODING_PROVIDER = 'main.geocoding.NominatimProvider'
+GEOCODING_FIXTURES = None
+GEOCODING_CACHE_TTL_DAYS = 30
+GEOCODING_NEGATIVE_TTL_HOURS = 24
+
+# Mechanic location pings are buffered and written with bulk_create when either
+# threshold is reached (see main/location_writer.py)
+LOCATION_WRITE_BATCH_SIZE = 200
+LOCATION_WRITE_FLUSH_INTERVAL = 2.0  # seconds
+# Rows kept for retry while the database is failing writes; the oldest go first
+LOCATION_WRITE_MAX_BUFFER = 5000
+
+# Largest batch of buffered fixes a reconnecting mechanic app may upload at once
+LOCATION_MAX_BATCH_POINTS = 500
+
+# Pings closer than this distance or interval to the last accepted ping for the
+# same job (and with the same job status) are dropped
+LOCATION_MIN_DISTANCE_M = 15
+LOCATION_MIN_INTERVAL_S = 5
+
+# Per-job ping filter and ETA state is dropped when the job stops being
+# trackable, or after this many seconds without a ping
+LOCATION_STATE_TTL_S = 60 * 60
+
+# Raw MechanicLocation rows older than this are rolled up and deleted by
+# `manage.py prune_locations` (run it from cron)
+LOCATION_RETENTION_DAYS = 30
+
+# Longest a job may run; the service calendar relies on it to bound its queries
+JOB_MAX_DURATION_DAYS = 7
+
+# Live ETA: fallback speed, and how much / how often the published ETA may change
+ETA_DEFAULT_SPEED_KMH = 25
+ETA_MIN_CHANGE_S = 30
+ETA_MIN_INTERVAL_S = 15
+
+# Mechanic/request matching: search radius and how often each worker rebuilds
+# its in-process spatial index from the database (see main/geoindex.py)
+MECHANIC_MATCH_RADIUS_KM = 25
+GEOINDEX_REFRESH_SECONDS = 300
+
+# Mechanic availability index (see main/scheduling.py) and the window of
+# hours offered as free slots on the booking form
+SCHEDULE_REFRESH_SECONDS = 300
+BOOKING_FIRST_HOUR = 8
+BOOKING_LAST_HOUR = 20
+
+# Longest a cached dashboard fragment lives; writes retire it sooner (see main/fragments.py)
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# Requests per page on the mechanic request board and dashboard
+REQUEST_BOARD_PAGE_SIZE = 20
+
+# Job start/complete OTPs (see main/otp.py)
+OTP_TTL_SECONDS = 300
+OTP_MAX_ATTEMPTS = 5
+
+# Token-bucket limits per route and key (see main/ratelimit.py). "N/period"
+# allows bursts of N, refilling at N per period; keys are ip, user or
+# service_request. Buckets must be in a cache every worker shares.
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_CACHE = 'shared'
+RATE_LIMITS = {
+    'login': [{'key': 'ip', 'rate': '10/m'}],
+    'signup': [{'key': 'ip', 'rate': '10/h'}],
+    'book_service': [{'key': 'user', 'rate': '10/h'}],
+    'verify_otp': [{'key': 'user', 'rate': '30/m'}, {'key': 'service_request', 'rate': '10/m'}],
+}
+
+# Auto-dispatch cost weights, in km of extra driving (see main/autodispatch.py)
+DISPATCH_SPECIALIZATION_PENALTY_KM = 5
+DISPATCH_RATING_WEIGHT_KM = 2
+DISPATCH_LOAD_WEIGHT_KM = 3
+DISPATCH_MAX_ACTIVE_JOBS = 3
+
+# Douglas-Peucker tolerance used when compacting a completed job's track
+TRACK_SIMPLIFY_TOLERANCE_M = 10
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,194 @@
+"""
+Batch assignment of pending service requests to available mechanics.
+
+Instead of first-come "Accept" clicks, ``plan_dispatch`` looks at every open,
+geocoded request and every approved mechanic with a known position at once,
+prices each pairing in a NumPy cost matrix and picks the cheapest overall
+matching with the Hungarian algorithm. Costs are in kilometres of driving:
+
+* the great-circle distance from the mechanic to the request,
+* ``DISPATCH_SPECIALIZATION_PENALTY_KM`` when a general mechanic takes a
+  specialised request (specialists never get requests outside their field),
+* ``DISPATCH_RATING_WEIGHT_KM`` per star below 5 of the mechanic's average rating,
+* ``DISPATCH_LOAD_WEIGHT_KM`` per job the mechanic already has on the go.
+
+Pairs further apart than ``MECHANIC_MATCH_RADIUS_KM`` are never matched.
+Assignments are written with ``claim_service_request``, so they race safely
+with mechanics accepting requests by hand.
+"""
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Avg, Count, Q
+
+from .dispatch import claim_service_request, NoJobForRequest, ScheduleConflict
+from .feed import GENERAL
+from .geoindex import ensure_indexes, mechanic_index
+from .models import Job, ServiceRequest
+from .scheduling import ACTIVE_JOB_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Stands in for "impossible" so the solver never has to do arithmetic on inf.
+INFEASIBLE = 1e9
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def solve_assignment(cost):
+    """
+    Minimum-cost assignment for a rectangular cost matrix.
+
+    Shortest-augmenting-path form of the Hungarian algorithm, O(n^2 m) with the
+    inner loop over columns vectorised. Returns (rows, cols) index arrays with
+    one entry per row (or per column, whichever dimension is smaller).
+    """
+    cost = np.asarray(cost, dtype=float)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    if n == 0:
+        empty = np.zeros(0, dtype=int)
+        return empty, empty
+
+    # 1-based as in the textbook formulation; column 0 is a virtual start node.
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of = np.zeros(m + 1, dtype=int)
+    way = np.zeros(m + 1, dtype=int)
+
+    for i in range(1, n + 1):
+        row_of[0] = i
+        j0 = 0
+        min_v = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = row_of[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < min_v[1:])
+            min_v[1:][better] = reduced[better]
+            way[1:][better] = j0
+
+            candidates = np.where(free, min_v[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            used_cols = np.flatnonzero(used)
+            u[row_of[used_cols]] += delta
+            v[used_cols] -= delta
+            min_v[1:][free] -= delta
+            j0 = j1
+            if row_of[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            row_of[j0] = row_of[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(row_of[1:])
+    rows = row_of[1:][cols] - 1
+    order = np.argsort(rows)
+    rows, cols = rows[order], cols[order]
+    return (cols, rows) if transposed else (rows, cols)
+
+
+def distance_matrix_km(lat1, lng1, lat2, lng2):
+    """Haversine distances between every point of the first and second set."""
+    lat1, lng1 = np.radians(lat1)[:, None], np.radians(lng1)[:, None]
+    lat2, lng2 = np.radians(lat2)[None, :], np.radians(lng2)[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def build_cost_matrix(requests, mechanics, radius_km=None):
+    """
+    requests: [(id, lat, lng, specialization), ...]
+    mechanics: [(id, lat, lng, specialization, average_rating or None, active_jobs), ...]
+    Returns a (len(requests), len(mechanics)) array, INFEASIBLE where a pair may not be matched.
+    """
+    radius_km = radius_km or getattr(settings, 'MECHANIC_MATCH_RADIUS_KM', 25)
+    _, req_lat, req_lng, req_spec = zip(*requests)
+    _, mech_lat, mech_lng, mech_spec, rating, load = zip(*mechanics)
+
+    distance = distance_matrix_km(np.array(req_lat), np.array(req_lng), np.array(mech_lat), np.array(mech_lng))
+
+    req_spec = np.array(req_spec, dtype=object)[:, None]
+    mech_spec = np.array([spec or GENERAL for spec in mech_spec], dtype=object)[None, :]
+    mech_general = mech_spec == GENERAL
+    exact = req_spec == mech_spec
+    allowed = exact | (req_spec == GENERAL) | mech_general
+
+    rating = np.array([np.nan if r is None else r for r in rating], dtype=float)
+    rating = np.where(np.isnan(rating), np.nanmean(rating) if not np.isnan(rating).all() else 5.0, rating)
+
+    cost = (
+        distance
+        + getattr(settings, 'DISPATCH_SPECIALIZATION_PENALTY_KM', 5) * (mech_general & ~exact)
+        + getattr(settings, 'DISPATCH_RATING_WEIGHT_KM', 2) * (5.0 - rating)[None, :]
+        + getattr(settings, 'DISPATCH_LOAD_WEIGHT_KM', 3) * np.array(load, dtype=float)[None, :]
+    )
+    cost[~allowed | (distance > radius_km)] = INFEASIBLE
+    return cost
+
+
+def load_candidates():
+    """The open requests and available mechanics that take part in a dispatch round."""
+    requests = list(ServiceRequest.objects.filter(
+        mechanic=None, status='pending', latitude__isnull=False, longitude__isnull=False,
+    ).values_list('id', 'latitude', 'longitude', 'specialization'))
+
+    ensure_indexes()
+    positions = mechanic_index.items()
+    stats = {
+        row['mechanic']: row
+        for row in Job.objects.filter(mechanic_id__in=[key for key, *_ in positions]).values('mechanic').annotate(
+            average_rating=Avg('rating', filter=Q(status='completed')),
+            active_jobs=Count('id', filter=Q(status__in=ACTIVE_JOB_STATUSES)),
+        )
+    }
+    max_active = getattr(settings, 'DISPATCH_MAX_ACTIVE_JOBS', 3)
+    mechanics = []
+    for mechanic_id, lat, lng, data in positions:
+        row = stats.get(mechanic_id, {})
+        active_jobs = row.get('active_jobs', 0)
+        if active_jobs >= max_active:
+            continue
+        mechanics.append((mechanic_id, lat, lng, data['specialization'], row.get('average_rating'), active_jobs))
+    return requests, mechanics
+
+
+def plan_dispatch(requests, mechanics, radius_km=None):
+    """[(request_id, mechanic_id, cost_km), ...] for the cheapest feasible matching."""
+    if not requests or not mechanics:
+        return []
+    cost = build_cost_matrix(requests, mechanics, radius_km)
+    rows, cols = solve_assignment(cost)
+    return [
+        (requests[row][0], mechanics[col][0], float(cost[row, col]))
+        for row, col in zip(rows, cols)
+        if cost[row, col] < INFEASIBLE
+    ]
+
+
+def dispatch_pending(dry_run=False):
+    """Run one dispatch round. Returns the plan and the request ids actually claimed."""
+    plan = plan_dispatch(*load_candidates())
+    if dry_run:
+        return plan, []
+
+    mechanics = User.objects.in_bulk([mechanic_id for _, mechanic_id, _ in plan])
+    claimed = []
+    for request_id, mechanic_id, cost in plan:
+        try:
+            if claim_service_request(request_id, mechanics[mechanic_id]):
+                claimed.append(request_id)
+        except NoJobForRequest:
+            logger.warning(f"Auto-dispatch skipped ServiceRequest {request_id}: no job to assign")
+        except ScheduleConflict:
+            logger.info(f"Auto-dispatch skipped ServiceRequest {request_id}: clashes with mechanic {mechanic_id}'s schedule")
+    logger.info(f"Auto-dispatch assigned {len(claimed)} of {len(plan)} planned requests")
+    return plan, claimed
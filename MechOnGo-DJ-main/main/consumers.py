@@ -1,63 +1,361 @@
-from channels.generic.websocket import JsonWebsocketConsumer
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import MechanicLocation, Job
+from django.db.models import Q
+from .models import MechanicLocation, Job, UserProfile
+from .feed import feed_group_name, feed_specializations
+from .customer_events import customer_group_name
+from .location_writer import location_writer
+from .geoindex import mechanic_position, move_mechanic
+from .tracking import (
+    TRACKABLE_JOB_STATUSES, job_group_name, mechanic_group_name,
+    aget_last_position, aset_last_position, aset_mechanic_position, ping_filter, eta_estimator,
+    parse_client_timestamp, haversine_m,
+)
 from django.utils import timezone
+import json
 import logging
+import msgpack
 
 logger = logging.getLogger(__name__)
 
-class MechanicLocationConsumer(JsonWebsocketConsumer):
-    def connect(self):
+
+class MsgPackJsonMixin:
+    """
+    Lets a JSON consumer speak MessagePack binary frames instead.
+
+    Clients opt in by offering the "msgpack" WebSocket subprotocol; everyone
+    else keeps getting JSON text frames.
+    """
+    msgpack_subprotocol = 'msgpack'
+    use_msgpack = False
+
+    async def accept(self, subprotocol=None, headers=None):
+        if subprotocol is None and self.msgpack_subprotocol in self.scope.get('subprotocols', []):
+            self.use_msgpack = True
+            subprotocol = self.msgpack_subprotocol
+        await super().accept(subprotocol, headers)
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        if text_data is not None:
+            try:
+                content = await self.decode_json(text_data)
+            except json.JSONDecodeError:
+                await self.send_json({'error': 'Malformed JSON frame'})
+                return
+        else:
+            try:
+                content = msgpack.unpackb(bytes_data)
+            except (ValueError, msgpack.UnpackException):
+                await self.send_json({'error': 'Malformed MessagePack frame'})
+                return
+        await self.receive_json(content, **kwargs)
+
+    async def send_json(self, content, close=False):
+        if self.use_msgpack:
+            await self.send(bytes_data=msgpack.packb(content), close=close)
+        else:
+            await super().send_json(content, close=close)
+
+
+class MechanicLocationConsumer(MsgPackJsonMixin, AsyncJsonWebsocketConsumer):
+    async def connect(self):
         self.mechanic_id = self.scope['url_route']['kwargs']['mechanic_id']
-        self.group_name = f'mechanic_location_{self.mechanic_id}'
-        
-        try:
-            self.mechanic = User.objects.get(id=self.mechanic_id)
-            self.channel_layer.group_add(self.group_name, self.channel_name)
-            self.accept()
-            logger.info(f"WebSocket connected for mechanic {self.mechanic.username}")
-        except User.DoesNotExist:
-            self.close()
-            logger.error(f"WebSocket connection failed: Mechanic ID {self.mechanic_id} not found")
-
-    def disconnect(self, close_code):
-        self.channel_layer.group_discard(self.group_name, self.channel_name)
+        self.group_name = mechanic_group_name(self.mechanic_id)
+
+        # Only the mechanic themself may report their location.
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated or str(user.id) != self.mechanic_id:
+            await self.close()
+            logger.error(f"WebSocket connection refused: not signed in as mechanic {self.mechanic_id}")
+            return
+        self.mechanic = user
+
+        await self.load_active_jobs()
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        logger.info(f"WebSocket connected for mechanic {self.mechanic.username}")
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        await location_writer.drain()
         logger.info(f"WebSocket disconnected for mechanic {self.mechanic_id}")
 
-    def receive_json(self, content):
+    async def load_active_jobs(self):
+        """Cache the jobs this mechanic may currently report locations for, with their destinations."""
+        self.active_jobs = {
+            job_id: {'status': status, 'destination': (latitude, longitude), 'customer_id': customer_id}
+            async for job_id, status, latitude, longitude, customer_id in Job.objects.filter(
+                mechanic=self.mechanic, status__in=TRACKABLE_JOB_STATUSES
+            ).values_list(
+                'id', 'status', 'service_request__latitude', 'service_request__longitude',
+                'service_request__customer_id',
+            )
+        }
+
+    async def receive_json(self, content):
+        if not isinstance(content, dict):
+            await self.send_json({'error': 'Expected an object'})
+            return
+
+        if 'points' in content:
+            await self.receive_points(content)
+            return
+
         latitude = content.get('latitude')
         longitude = content.get('longitude')
         job_id = content.get('job_id')
 
         if not latitude or not longitude or not job_id:
-            self.send_json({'error': 'Missing required fields'})
+            await self.send_json({'error': 'Missing required fields'})
             return
 
         try:
-            job = Job.objects.get(id=job_id, mechanic=self.mechanic, status__in=['en_route', 'in_progress'])
-            MechanicLocation.objects.create(
-                mechanic=self.mechanic,
-                job=job,
-                latitude=latitude,
-                longitude=longitude
-            )
-            self.channel_layer.group_send(
-                self.group_name,
-                {
-                    'type': 'location_update',
-                    'latitude': latitude,
-                    'longitude': longitude,
-                    'timestamp': timezone.now().isoformat()
-                }
-            )
-            logger.info(f"Location updated for mechanic {self.mechanic.username} for job {job_id}")
-        except Job.DoesNotExist:
-            self.send_json({'error': 'Invalid job or not authorized'})
+            latitude, longitude = float(latitude), float(longitude)
+        except (TypeError, ValueError):
+            await self.send_json({'error': 'Invalid coordinates'})
+            return
+
+        job_id, active_job = await self.authorize_job(job_id)
+        if active_job is None:
+            return
+
+        received_at = timezone.now()
+        if not ping_filter.accept(job_id, latitude, longitude, active_job['status'], at=received_at.timestamp()):
+            return
+
+        # Persisted in batches by the write-behind buffer; subscribers don't wait on it.
+        location_writer.add(MechanicLocation(
+            mechanic=self.mechanic,
+            job_id=job_id,
+            latitude=latitude,
+            longitude=longitude,
+            timestamp=received_at,
+        ))
+        await self.publish_position(job_id, active_job, latitude, longitude, received_at)
+        logger.info(f"Location updated for mechanic {self.mechanic.username} for job {job_id}")
+
+    async def receive_points(self, content):
+        """
+        Handles a batch of buffered fixes, e.g. replayed after the app regains signal:
+        {"job_id": 1, "points": [{"latitude": .., "longitude": .., "timestamp": ..}, ...]}
+        """
+        job_id, active_job = await self.authorize_job(content.get('job_id'))
+        if active_job is None:
+            return
+
+        points = content['points']
+        max_points = getattr(settings, 'LOCATION_MAX_BATCH_POINTS', 500)
+        if not isinstance(points, list) or not points or len(points) > max_points:
+            await self.send_json({'error': f'points must be a list of 1 to {max_points} fixes'})
+            return
+
+        # Live pings are timed by the server, so a client clock running ahead
+        # must not make replayed fixes look newer than them.
+        received_at = timezone.now()
+        parsed = []
+        for point in points:
+            try:
+                latitude, longitude = float(point['latitude']), float(point['longitude'])
+                timestamp = min(parse_client_timestamp(point['timestamp']), received_at)
+            except (KeyError, TypeError, ValueError):
+                await self.send_json({'error': 'Invalid point in batch'})
+                return
+            parsed.append((latitude, longitude, timestamp))
+        parsed.sort(key=lambda point: point[2])
+
+        keep = ping_filter.accept_many(
+            job_id, [(lat, lng, ts.timestamp()) for lat, lng, ts in parsed], active_job['status']
+        )
+        accepted = [point for point, kept in zip(parsed, keep) if kept]
+
+        # Already a batch: one INSERT, bypassing the write-behind buffer.
+        await MechanicLocation.objects.abulk_create([
+            MechanicLocation(mechanic=self.mechanic, job_id=job_id, latitude=lat, longitude=lng, timestamp=ts)
+            for lat, lng, ts in accepted
+        ])
+        await self.send_json({'batch': {'received': len(parsed), 'stored': len(accepted)}})
+
+        # Only the newest fix matters to subscribers, and only if nothing newer was already shown.
+        if accepted and accepted[-1][2].timestamp() >= ping_filter.last_accepted_at(job_id):
+            latitude, longitude, timestamp = accepted[-1]
+            await self.publish_position(job_id, active_job, latitude, longitude, timestamp)
+        logger.info(f"Stored {len(accepted)} of {len(parsed)} batched locations for job {job_id}")
+
+    async def authorize_job(self, job_id):
+        """Returns (job_id, cached job info), or (None, None) after telling the client why not."""
+        try:
+            job_id = int(job_id)
+        except (TypeError, ValueError):
+            job_id = None
+        active_job = self.active_jobs.get(job_id)
+        if active_job is None:
+            await self.send_json({'error': 'Invalid job or not authorized'})
             logger.error(f"Invalid job {job_id} for mechanic {self.mechanic_id}")
+            return None, None
+        return job_id, active_job
+
+    async def publish_position(self, job_id, active_job, latitude, longitude, timestamp):
+        position = {
+            'latitude': latitude,
+            'longitude': longitude,
+            'timestamp': timestamp.isoformat(),
+            'eta_seconds': eta_estimator.update(
+                job_id, latitude, longitude, active_job['destination'], at=timestamp.timestamp()
+            ),
+        }
+        await aset_last_position(job_id, position)
+        # Shared with every process for matching; this one's index follows at once.
+        await aset_mechanic_position(self.mechanic.id, latitude, longitude, timestamp.timestamp())
+        move_mechanic(self.mechanic.id, latitude, longitude, timestamp.timestamp())
+        event = {'type': 'location_update', **position}
+        await self.channel_layer.group_send(self.group_name, event)
+        await self.channel_layer.group_send(job_group_name(job_id), event)
+        await self.publish_eta(job_id, active_job, position['eta_seconds'])
+
+    async def publish_eta(self, job_id, active_job, eta_seconds):
+        """Push the ETA to the customer's dashboard, but only when the shown minute count changes."""
+        if eta_seconds is None:
+            return
+        eta_minutes = max(1, round(eta_seconds / 60))
+        if active_job.get('eta_minutes') == eta_minutes:
+            return
+        active_job['eta_minutes'] = eta_minutes
+        await self.channel_layer.group_send(customer_group_name(active_job['customer_id']), {
+            'type': 'eta_updated', 'job_id': job_id, 'eta_minutes': eta_minutes,
+        })
 
-    def location_update(self, event):
-        self.send_json({
+    async def location_update(self, event):
+        await self.send_json({
             'latitude': event['latitude'],
             'longitude': event['longitude'],
-            'timestamp': event['timestamp']
-        })
\ No newline at end of file
+            'timestamp': event['timestamp'],
+            'eta_seconds': event.get('eta_seconds'),
+        })
+
+    async def jobs_changed(self, event):
+        """Sent by views whenever one of this mechanic's jobs changes status."""
+        previous = set(self.active_jobs)
+        await self.load_active_jobs()
+        for job_id in previous - set(self.active_jobs):
+            ping_filter.forget(job_id)
+            eta_estimator.forget(job_id)
+
+
+class JobLocationConsumer(MsgPackJsonMixin, AsyncJsonWebsocketConsumer):
+    """Read-only feed of a single job's mechanic position for the tracking page."""
+
+    async def connect(self):
+        self.job_id = int(self.scope['url_route']['kwargs']['job_id'])
+        self.group_name = job_group_name(self.job_id)
+        user = self.scope.get('user')
+
+        if not user or not user.is_authenticated:
+            await self.close()
+            return
+
+        is_participant = await Job.objects.filter(
+            Q(service_request__customer=user) | Q(mechanic=user), id=self.job_id
+        ).aexists()
+        if not is_participant:
+            await self.close()
+            logger.error(f"User {user.username} is not allowed to track job {self.job_id}")
+            return
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        # Hydrate the map straight away instead of waiting for the next ping.
+        position = await aget_last_position(self.job_id)
+        if position:
+            await self.send_json(position)
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def location_update(self, event):
+        await self.send_json({
+            'latitude': event['latitude'],
+            'longitude': event['longitude'],
+            'timestamp': event['timestamp'],
+            'eta_seconds': event.get('eta_seconds'),
+        })
+
+
+class MechanicFeedConsumer(MsgPackJsonMixin, AsyncJsonWebsocketConsumer):
+    """Pushes new and withdrawn service requests to a mechanic's dashboard."""
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.close()
+            return
+
+        profile = await UserProfile.objects.filter(
+            user=user, is_mechanic=True, is_approved=True
+        ).values('specialization').afirst()
+        if profile is None:
+            await self.close()
+            logger.error(f"User {user.username} is not an approved mechanic and cannot join the request feed")
+            return
+
+        self.user = user
+        self.group_names = [feed_group_name(specialization) for specialization in feed_specializations(profile['specialization'])]
+        for group_name in self.group_names:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        for group_name in getattr(self, 'group_names', []):
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+
+    async def request_created(self, event):
+        # Same radius rule as the board: requests without coordinates are shown to everyone.
+        request = event['request']
+        if event.get('location'):
+            origin = await database_sync_to_async(mechanic_position)(self.user)
+            if origin:
+                distance_km = haversine_m(*origin, *event['location']) / 1000
+                if distance_km > getattr(settings, 'MECHANIC_MATCH_RADIUS_KM', 25):
+                    return
+                request = {**request, 'distance_km': round(distance_km, 1)}
+        await self.send_json({'event': 'request_created', 'request': request})
+
+    async def request_closed(self, event):
+        await self.send_json({'event': 'request_closed', 'id': event['id']})
+
+
+class CustomerEventsConsumer(MsgPackJsonMixin, AsyncJsonWebsocketConsumer):
+    """Pushes OTP and booking events to a customer's dashboard."""
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.close()
+            return
+
+        if await UserProfile.objects.filter(user=user, is_mechanic=True).aexists():
+            await self.close()
+            logger.error(f"User {user.username} is a mechanic and cannot join the customer events channel")
+            return
+
+        self.group_name = customer_group_name(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def otp_issued(self, event):
+        await self.send_json({'event': 'otp_issued', 'request_id': event['request_id'], 'action': event['action']})
+
+    async def otp_consumed(self, event):
+        await self.send_json({'event': 'otp_consumed', 'request_id': event['request_id'], 'action': event['action']})
+
+    async def bookings_changed(self, event):
+        await self.send_json({'event': 'bookings_changed'})
+
+    async def eta_updated(self, event):
+        await self.send_json({'event': 'eta_updated', 'job_id': event['job_id'], 'eta_minutes': event['eta_minutes']})
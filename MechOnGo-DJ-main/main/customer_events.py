@@ -0,0 +1,40 @@
+"""
+Per-customer push channel.
+
+Each customer dashboard keeps a socket to ``CustomerEventsConsumer``, which
+joins the customer's own channel-layer group. Views publish small events to
+that group (an OTP was issued or used, a booking changed), and the dashboard
+reacts by fetching its bookings delta. ETA changes carry the new value, so
+the dashboard updates them in place without a fetch.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def customer_group_name(user_id):
+    return f'customer_events_{user_id}'
+
+
+def _send(user_id, event):
+    try:
+        async_to_sync(get_channel_layer().group_send)(customer_group_name(user_id), event)
+    except Exception:
+        logger.warning(f"Could not publish {event['type']} to customer {user_id}", exc_info=True)
+
+
+def publish_customer_event(user_id, event_type, **payload):
+    """Push an event to the customer's open dashboards once the current transaction commits."""
+    if not user_id:
+        return
+    event = {'type': event_type, **payload}
+    transaction.on_commit(lambda: _send(user_id, event))
+
+
+def publish_bookings_changed(customer_id):
+    """Tell the customer's dashboards that one of their bookings changed."""
+    publish_customer_event(customer_id, 'bookings_changed')
@@ -0,0 +1,79 @@
+"""
+Assignment of pending service requests to mechanics.
+
+``claim_service_request`` is the single write path used by the "Accept"
+button and by auto-dispatch. The claim is one conditional UPDATE, so when
+several mechanics race for the same request the database picks exactly one
+winner and nobody has to read the row first. The schedule check is made
+against the database too, with the mechanic's row locked, because the
+in-process schedule index may lag behind other workers.
+"""
+import logging
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .customer_events import publish_bookings_changed
+from .feed import publish_request_closed
+from .geoindex import request_index
+from .models import ServiceRequest, Job
+from .scheduling import ACTIVE_JOB_STATUSES, schedule_index
+from .stats import apply_job_change, job_stats_state
+from .tracking import notify_jobs_changed
+from .versions import bump_user_versions
+
+logger = logging.getLogger(__name__)
+
+
+class NoJobForRequest(Exception):
+    """The request exists but has no Job to assign; the claim was rolled back."""
+
+
+class ScheduleConflict(Exception):
+    """The job overlaps one the mechanic already has; the claim was rolled back."""
+
+
+def claim_service_request(request_id, mechanic):
+    """
+    Assign a pending, unassigned request and its job to the mechanic.
+    Returns True if this call won the request, False if it was already taken.
+    Raises ScheduleConflict if the job clashes with the mechanic's schedule.
+    """
+    with transaction.atomic():
+        claimed = ServiceRequest.objects.filter(
+            id=request_id, mechanic=None, status='pending'
+        ).update(mechanic=mechanic, status='accepted', updated_at=timezone.now())
+        if not claimed:
+            return False
+        job = Job.objects.filter(service_request_id=request_id).values_list(
+            'id', 'start_time', 'end_time', 'status', 'rating'
+        ).first()
+        if job is None:
+            raise NoJobForRequest(request_id)
+        job_id, start_time, end_time, status, rating = job
+        # Claims for the same mechanic queue up here, so each one sees the
+        # jobs the previous one booked.
+        list(User.objects.select_for_update().filter(id=mechanic.id).values_list('id', flat=True))
+        if Job.objects.filter(
+            mechanic=mechanic, status__in=ACTIVE_JOB_STATUSES, start_time__lt=end_time, end_time__gt=start_time,
+        ).exclude(id=job_id).exists():
+            raise ScheduleConflict(request_id)
+        Job.objects.filter(id=job_id).update(mechanic=mechanic, status='scheduled', updated_at=timezone.now())
+        # update() bypasses post_save, so the dashboards are told here.
+        customer_id, specialization = ServiceRequest.objects.filter(id=request_id).values_list(
+            'customer_id', 'specialization'
+        ).first()
+        publish_request_closed(request_id, specialization)
+        apply_job_change(
+            job_stats_state(customer_id, None, status, rating, start_time),
+            job_stats_state(customer_id, mechanic.id, 'scheduled', rating, start_time),
+        )
+
+    request_index.remove(request_id)
+    schedule_index.add_job(mechanic.id, job_id, start_time, end_time)
+    bump_user_versions(customer_id, mechanic.id)
+    publish_bookings_changed(customer_id)
+    notify_jobs_changed(mechanic.id)
+    logger.info(f"Service request {request_id} claimed by mechanic {mechanic.username}")
+    return True
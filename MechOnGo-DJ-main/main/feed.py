@@ -0,0 +1,73 @@
+"""
+Live board of open service requests for mechanics.
+
+Every mechanic dashboard keeps a socket to ``MechanicFeedConsumer`` which joins
+one channel-layer group per specialization it should hear about: specialists
+follow their own specialization plus "general", general mechanics follow all of
+them. New bookings are pushed to the group of the request's specialization and
+requests that stop being open are withdrawn from the same group, so boards stay
+current without reloading the dashboard.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+GENERAL = 'general'
+SPECIALIZATIONS = [value for value, _ in UserProfile.SPECIALIZATION_CHOICES]
+
+
+def feed_group_name(specialization):
+    return f'request_feed_{specialization}'
+
+
+def feed_specializations(mechanic_specialization):
+    """The request specializations a mechanic with this specialization gets to see."""
+    if not mechanic_specialization or mechanic_specialization == GENERAL:
+        return SPECIALIZATIONS
+    return [mechanic_specialization, GENERAL]
+
+
+def request_payload(service_request):
+    """The compact form of a request that is pushed to dashboards."""
+    preferred = service_request.preferred_datetime
+    return {
+        'id': service_request.id,
+        'specialization': service_request.specialization,
+        'issue': (service_request.issue_description or '')[:140],
+        'customer': service_request.customer.get_full_name(),
+        'vehicle': f"{service_request.vehicle_make or ''} {service_request.vehicle_model or ''} ({service_request.vehicle_year or ''})".strip(),
+        'preferred_datetime': preferred.isoformat() if preferred else None,
+        'estimated_cost': str(service_request.estimated_cost) if service_request.estimated_cost is not None else None,
+    }
+
+
+def _send(specialization, event):
+    try:
+        async_to_sync(get_channel_layer().group_send)(feed_group_name(specialization or GENERAL), event)
+    except Exception:
+        logger.warning(f"Could not publish {event['type']} to the {specialization} request feed", exc_info=True)
+
+
+def publish_new_request(service_request):
+    """
+    Push a freshly booked request to matching mechanics once it is committed.
+    The location travels beside the payload so consumers can apply the radius
+    filter without handing customers' coordinates to the browser.
+    """
+    payload = request_payload(service_request)
+    location = None
+    if service_request.latitude is not None and service_request.longitude is not None:
+        location = (service_request.latitude, service_request.longitude)
+    event = {'type': 'request_created', 'request': payload, 'location': location}
+    transaction.on_commit(lambda: _send(payload['specialization'], event))
+
+
+def publish_request_closed(request_id, specialization):
+    """Withdraw a request from every board that could be showing it."""
+    transaction.on_commit(lambda: _send(specialization, {'type': 'request_closed', 'id': request_id}))
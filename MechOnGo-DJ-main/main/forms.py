@@ -129,10 +129,18 @@ class MechanicProfileForm(forms.ModelForm):
         widget=forms.Textarea(attrs={'rows': 2}),
         required=False
     )
+    base_latitude = forms.FloatField(min_value=-90, max_value=90, required=False)
+    base_longitude = forms.FloatField(min_value=-180, max_value=180, required=False)
 
     class Meta:
         model = UserProfile
-        fields = ['phone', 'avatar', 'specialization', 'years_of_experience', 'certifications']
+        fields = ['phone', 'avatar', 'specialization', 'years_of_experience', 'certifications', 'base_latitude', 'base_longitude']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if (cleaned_data.get('base_latitude') is None) != (cleaned_data.get('base_longitude') is None):
+            raise forms.ValidationError("Please provide both latitude and longitude for your base location.")
+        return cleaned_data
 
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
@@ -179,6 +187,12 @@ class ServiceRequestForm(forms.ModelForm):
         required=True,
         help_text='Describe the issue with your vehicle.'
     )
+    specialization = forms.ChoiceField(
+        choices=UserProfile.SPECIALIZATION_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-input'}),
+        initial='general',
+        help_text='The kind of mechanic best suited to the job.'
+    )
     preferred_date = forms.DateField(
         widget=forms.DateInput(attrs={
             'type': 'text',
@@ -267,7 +281,7 @@ class ServiceRequestForm(forms.ModelForm):
     class Meta:
         model = ServiceRequest
         fields = [
-            'issue_description', 'preferred_date', 'preferred_time',
+            'issue_description', 'specialization', 'preferred_date', 'preferred_time',
             'vehicle_make', 'vehicle_model', 'vehicle_year',
             'vehicle_license', 'location', 'phone_number',
             'additional_notes', 'payment_method', 'estimated_cost'
@@ -0,0 +1,70 @@
+"""
+Rendered dashboard fragments, cached per user version.
+
+The booking and job lists only change when one of the user's jobs, requests
+or invoices is written, and every such write bumps the user's version (see
+``main.versions``). Fragments are stored under a key that includes that
+version, so they are reused until the next write and never need explicit
+invalidation: a bump simply makes the old key unreachable. Fragments and
+versions both live in the shared cache, so a write on one worker retires the
+fragments every worker would serve.
+
+Anything that changes without a write (live ETAs and positions) is kept out
+of the cached HTML and applied by the page. Fragments showing an OTP expire
+with it.
+"""
+import math
+
+from django.conf import settings
+from django.utils import timezone
+
+from .sharedcache import shared_cache as cache
+from .versions import user_version
+
+# Upper bound on how long a fragment lives; a version bump retires it sooner.
+FRAGMENT_TIMEOUT = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 60 * 60)
+
+
+class FragmentCache:
+    """
+    Fragments are dicts built by a render callback: ``html`` plus whatever the
+    view needs alongside it (job ids, counts). An optional ``expires_at``
+    shortens the entry's lifetime. Hit and miss counters live in process memory.
+    """
+
+    def __init__(self):
+        self._counters = {}
+
+    def key(self, name, user_id, vary_on=()):
+        parts = [name, str(user_id), str(user_version(user_id)), *map(str, vary_on)]
+        return 'fragments:' + ':'.join(parts)
+
+    def get_or_render(self, name, user_id, render, vary_on=()):
+        # The version is read before rendering: a write that lands meanwhile
+        # bumps it, so what we store is never served for the newer state.
+        key = self.key(name, user_id, vary_on)
+        counters = self._counters.setdefault(name, {'hits': 0, 'misses': 0})
+        fragment = cache.get(key)
+        if fragment is not None:
+            counters['hits'] += 1
+            return fragment
+
+        counters['misses'] += 1
+        fragment = render()
+        timeout = FRAGMENT_TIMEOUT
+        if fragment.get('expires_at'):
+            remaining = (fragment['expires_at'] - timezone.now()).total_seconds()
+            timeout = min(timeout, math.ceil(remaining))
+        if timeout > 0:
+            cache.set(key, fragment, timeout)
+        return fragment
+
+    def stats(self):
+        stats = {}
+        for name, counters in self._counters.items():
+            lookups = counters['hits'] + counters['misses']
+            stats[name] = {**counters, 'hit_ratio': round(counters['hits'] / lookups, 3) if lookups else None}
+        return stats
+
+
+fragment_cache = FragmentCache()
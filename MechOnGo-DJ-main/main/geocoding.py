@@ -0,0 +1,178 @@
+"""
+Geocoding of free-text service request addresses.
+
+Lookups go through a persistent GeocodeCache table keyed by the normalized
+address, so each distinct address hits the provider at most once per TTL.
+Addresses the provider could not resolve are cached too (for a shorter time)
+so they aren't retried on every booking.
+
+The provider is pluggable through ``settings.GEOCODING_PROVIDER``; use
+``main.geocoding.FixtureProvider`` with ``GEOCODING_FIXTURES`` to run without
+network access. Bookings are geocoded on a background thread after the
+transaction commits, so ``book_service`` never waits on the provider. New
+requests are announced on the mechanics' live feed from there too, once their
+coordinates are known, so the feed can apply its radius filter; if the lookup
+fails they are announced without a location.
+"""
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .feed import publish_new_request
+from .geoindex import index_request
+from .models import GeocodeCache, ServiceRequest
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodingError(Exception):
+    """The provider could not be reached; the lookup should be retried later."""
+
+
+def normalize_address(address):
+    address = unicodedata.normalize('NFKC', address or '').lower()
+    address = re.sub(r'\s*,\s*', ', ', address)
+    address = re.sub(r'\s+', ' ', address)
+    return address.strip(' ,.')
+
+
+class NominatimProvider:
+    url = 'https://nominatim.openstreetmap.org/search'
+    # Nominatim's usage policy allows at most one request per second.
+    min_interval = 1.0
+    _lock = threading.Lock()
+    _last_call = 0.0
+
+    def geocode(self, query):
+        params = urllib.parse.urlencode({'q': query, 'format': 'json', 'limit': 1})
+        req = urllib.request.Request(
+            f'{self.url}?{params}',
+            headers={'User-Agent': settings.NOMINATIM_USER_AGENT},
+        )
+        with self._lock:
+            wait = self.min_interval - (time.monotonic() - NominatimProvider._last_call)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                with urllib.request.urlopen(req, timeout=10) as response:
+                    results = json.load(response)
+            except (OSError, ValueError) as e:
+                raise GeocodingError(str(e)) from e
+            finally:
+                NominatimProvider._last_call = time.monotonic()
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon'])
+
+
+class FixtureProvider:
+    """Offline stand-in that resolves addresses from a JSON file of {"address": [lat, lng]}."""
+
+    def __init__(self, fixtures=None):
+        if fixtures is None:
+            path = getattr(settings, 'GEOCODING_FIXTURES', None)
+            fixtures = {}
+            if path:
+                with open(path) as f:
+                    fixtures = json.load(f)
+        self.fixtures = {normalize_address(address): tuple(coords) for address, coords in fixtures.items()}
+
+    def geocode(self, query):
+        return self.fixtures.get(query)
+
+
+def get_provider():
+    return import_string(getattr(settings, 'GEOCODING_PROVIDER', 'main.geocoding.NominatimProvider'))()
+
+
+def geocode(address, provider=None):
+    """Returns (lat, lng) for an address, or None if it can't be resolved."""
+    query = normalize_address(address)
+    if not query:
+        return None
+
+    now = timezone.now()
+    cached = GeocodeCache.objects.filter(query=query, expires_at__gt=now).first()
+    if cached is not None:
+        if cached.latitude is None:
+            return None
+        return cached.latitude, cached.longitude
+
+    provider = provider or get_provider()
+    coords = provider.geocode(query)
+    if coords is None:
+        ttl = timedelta(hours=getattr(settings, 'GEOCODING_NEGATIVE_TTL_HOURS', 24))
+    else:
+        ttl = timedelta(days=getattr(settings, 'GEOCODING_CACHE_TTL_DAYS', 30))
+    GeocodeCache.objects.update_or_create(query=query, defaults={
+        'latitude': coords[0] if coords else None,
+        'longitude': coords[1] if coords else None,
+        'provider': type(provider).__name__,
+        'expires_at': now + ttl,
+    })
+    return coords
+
+
+def geocode_service_request(service_request_id):
+    """Fill in a request's coordinates from its location text."""
+    service_request = ServiceRequest.objects.filter(id=service_request_id).first()
+    if service_request is None or not service_request.location:
+        return None
+    coords = geocode(service_request.location)
+    if coords is None:
+        logger.info(f"Could not geocode location of ServiceRequest {service_request_id}")
+        return None
+    ServiceRequest.objects.filter(id=service_request_id).update(latitude=coords[0], longitude=coords[1])
+    service_request.latitude, service_request.longitude = coords
+    index_request(service_request)
+    return coords
+
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='geocoding')
+
+
+def publish_if_open(service_request_id):
+    """Announce the request on the live feed, unless it was taken or withdrawn meanwhile."""
+    service_request = ServiceRequest.objects.select_related('customer').filter(
+        id=service_request_id, status='pending', mechanic=None
+    ).first()
+    if service_request is not None:
+        publish_new_request(service_request)
+
+
+def _run_geocoding(service_request_id, publish=False):
+    close_old_connections()
+    try:
+        geocode_service_request(service_request_id)
+    except GeocodingError as e:
+        logger.warning(f"Geocoding provider unavailable for ServiceRequest {service_request_id}: {e}")
+    except Exception:
+        logger.exception(f"Geocoding failed for ServiceRequest {service_request_id}")
+    try:
+        if publish:
+            publish_if_open(service_request_id)
+    except Exception:
+        logger.exception(f"Could not announce ServiceRequest {service_request_id}")
+    finally:
+        close_old_connections()
+
+
+def schedule_geocoding(service_request, publish=False):
+    """
+    Geocode the request in the background once the current transaction commits.
+    With publish=True, announce it on the mechanics' feed afterwards.
+    """
+    service_request_id = service_request.id
+    transaction.on_commit(lambda: _executor.submit(_run_geocoding, service_request_id, publish))
@@ -0,0 +1,246 @@
+"""
+In-process spatial indexes used to match mechanics and service requests by distance.
+
+Points are bucketed into a uniform latitude/longitude grid, so a radius or
+k-nearest query only looks at the handful of cells around the origin instead
+of every row. Two indexes are kept per process:
+
+* ``mechanic_index``: approved mechanics, at their live position while they
+  are sharing one, else at their home base.
+* ``request_index``: pending, unassigned service requests with coordinates.
+
+Both are built lazily from the database, kept current by signals in
+``main.signals`` and rebuilt every ``GEOINDEX_REFRESH_SECONDS`` to pick up
+changes made by other worker processes. Live positions come from the shared
+tracking cache (``main.tracking.get_mechanic_positions``), so every process
+sees them on its next rebuild, and a rebuild never moves a mechanic back from
+a fresher live position to an older one.
+"""
+import heapq
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .models import UserProfile, ServiceRequest
+from .tracking import get_mechanic_positions, haversine_m, live_position_timeout
+
+KM_PER_DEGREE = 111.32
+
+
+class GridIndex:
+    def __init__(self, cell_deg=0.05):
+        self.cell_deg = cell_deg
+        self._cells = {}
+        self._points = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, key):
+        return key in self._points
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def get(self, key):
+        """Returns (lat, lng, data) for key, or None."""
+        return self._points.get(key)
+
+    def items(self):
+        """Snapshot of all points as [(key, lat, lng, data), ...]."""
+        with self._lock:
+            return [(key, lat, lng, data) for key, (lat, lng, data) in self._points.items()]
+
+    def upsert(self, key, lat, lng, data=None):
+        with self._lock:
+            self._remove(key)
+            cell = self._cell(lat, lng)
+            self._cells.setdefault(cell, set()).add(key)
+            self._points[key] = (lat, lng, data)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        point = self._points.pop(key, None)
+        if point is None:
+            return
+        cell = self._cell(point[0], point[1])
+        keys = self._cells.get(cell)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._cells[cell]
+
+    def replace_all(self, points):
+        """Swap in a fresh set of (key, lat, lng, data) points."""
+        cells, by_key = {}, {}
+        for key, lat, lng, data in points:
+            cells.setdefault(self._cell(lat, lng), set()).add(key)
+            by_key[key] = (lat, lng, data)
+        with self._lock:
+            self._cells, self._points = cells, by_key
+
+    def within(self, lat, lng, radius_km, predicate=None):
+        """All points within radius_km as (distance_km, key, data), nearest first."""
+        d_lat = radius_km / KM_PER_DEGREE
+        d_lng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        min_row, min_col = self._cell(lat - d_lat, lng - d_lng)
+        max_row, max_col = self._cell(lat + d_lat, lng + d_lng)
+
+        found = []
+        with self._lock:
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    for key in self._cells.get((row, col), ()):
+                        p_lat, p_lng, data = self._points[key]
+                        if predicate is not None and not predicate(key, data):
+                            continue
+                        distance_km = haversine_m(lat, lng, p_lat, p_lng) / 1000
+                        if distance_km <= radius_km:
+                            found.append((distance_km, key, data))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def nearest(self, lat, lng, k, radius_km, predicate=None):
+        """The k nearest points within radius_km, searching outwards ring by ring."""
+        cell_km = self.cell_deg * KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        max_ring = int(math.ceil(radius_km / cell_km)) + 1
+        origin_row, origin_col = self._cell(lat, lng)
+        heap = []
+
+        with self._lock:
+            for ring in range(max_ring + 1):
+                for row in range(origin_row - ring, origin_row + ring + 1):
+                    for col in range(origin_col - ring, origin_col + ring + 1):
+                        if max(abs(row - origin_row), abs(col - origin_col)) != ring:
+                            continue
+                        for key in self._cells.get((row, col), ()):
+                            p_lat, p_lng, data = self._points[key]
+                            if predicate is not None and not predicate(key, data):
+                                continue
+                            distance_km = haversine_m(lat, lng, p_lat, p_lng) / 1000
+                            if distance_km <= radius_km:
+                                heapq.heappush(heap, (distance_km, key, data))
+                # Anything in a further ring is at least `ring` whole cells away.
+                if len(heap) >= k and heapq.nsmallest(k, heap)[-1][0] <= ring * cell_km:
+                    break
+        return heapq.nsmallest(k, heap)
+
+
+mechanic_index = GridIndex()
+request_index = GridIndex()
+_built_at = None
+_build_lock = threading.Lock()
+
+
+def _refresh_seconds():
+    return getattr(settings, 'GEOINDEX_REFRESH_SECONDS', 300)
+
+
+def _mechanic_point(user_id, specialization, base_lat, base_lng, live):
+    """(key, lat, lng, data) for the mechanic index, or None if the mechanic has no known position."""
+    # A live position moved into this process after `live` was read is fresher
+    # still, as long as it hasn't gone stale.
+    current = mechanic_index.get(user_id)
+    live_at = current[2].get('live_at') if current is not None else None
+    if (live_at and time.time() - live_at < live_position_timeout()
+            and (live is None or live_at > live[2])):
+        live = (current[0], current[1], live_at)
+    if live is not None:
+        return user_id, live[0], live[1], {'specialization': specialization, 'live_at': live[2]}
+    if base_lat is not None and base_lng is not None:
+        return user_id, base_lat, base_lng, {'specialization': specialization, 'live_at': None}
+    return None
+
+
+def rebuild_indexes():
+    global _built_at
+    mechanics = list(UserProfile.objects.filter(is_mechanic=True, is_approved=True).values_list(
+        'user_id', 'specialization', 'base_latitude', 'base_longitude'
+    ))
+    live = get_mechanic_positions([user_id for user_id, *_ in mechanics])
+    points = (
+        _mechanic_point(user_id, specialization, base_lat, base_lng, live.get(user_id))
+        for user_id, specialization, base_lat, base_lng in mechanics
+    )
+    mechanic_index.replace_all(point for point in points if point is not None)
+    request_index.replace_all(
+        (request_id, lat, lng, None)
+        for request_id, lat, lng in ServiceRequest.objects.filter(
+            mechanic=None, status='pending', latitude__isnull=False, longitude__isnull=False,
+        ).values_list('id', 'latitude', 'longitude')
+    )
+    _built_at = time.monotonic()
+
+
+def ensure_indexes():
+    if _built_at is None or time.monotonic() - _built_at > _refresh_seconds():
+        with _build_lock:
+            if _built_at is None or time.monotonic() - _built_at > _refresh_seconds():
+                rebuild_indexes()
+
+
+def index_mechanic(profile):
+    """Add, move or drop a mechanic after their profile changed."""
+    point = None
+    if profile.is_mechanic and profile.is_approved:
+        live = get_mechanic_positions([profile.user_id]).get(profile.user_id)
+        point = _mechanic_point(profile.user_id, profile.specialization,
+                                profile.base_latitude, profile.base_longitude, live)
+    if point is not None:
+        mechanic_index.upsert(*point)
+    else:
+        mechanic_index.remove(profile.user_id)
+
+
+def move_mechanic(mechanic_id, lat, lng, at):
+    """
+    Follow a mechanic's live position in this process. Only mechanics already
+    indexed (i.e. approved) are moved; other processes, and mechanics without
+    a home base, pick the position up from the tracking cache on rebuild.
+    """
+    point = mechanic_index.get(mechanic_id)
+    if point is not None and (point[2].get('live_at') or 0) <= at:
+        mechanic_index.upsert(mechanic_id, lat, lng, {**point[2], 'live_at': at})
+
+
+def index_request(service_request):
+    """Add or drop a service request after it was saved."""
+    if (service_request.status == 'pending' and service_request.mechanic_id is None
+            and service_request.latitude is not None and service_request.longitude is not None):
+        request_index.upsert(service_request.id, service_request.latitude, service_request.longitude)
+    else:
+        request_index.remove(service_request.id)
+
+
+def mechanic_position(user):
+    """Best known (lat, lng) for a mechanic: their recent live position, else home base."""
+    live = get_mechanic_positions([user.id]).get(user.id)
+    if live is not None:
+        return live[0], live[1]
+    profile = user.profile
+    if profile.base_latitude is not None and profile.base_longitude is not None:
+        return profile.base_latitude, profile.base_longitude
+    return None
+
+
+def nearest_mechanics(lat, lng, k=5, radius_km=None, specialization=None):
+    """[(distance_km, mechanic_id), ...] for the k nearest approved mechanics."""
+    ensure_indexes()
+    radius_km = radius_km or getattr(settings, 'MECHANIC_MATCH_RADIUS_KM', 25)
+    predicate = None
+    if specialization:
+        predicate = lambda key, data: data['specialization'] == specialization
+    return [(distance, key) for distance, key, _ in mechanic_index.nearest(lat, lng, k, radius_km, predicate)]
+
+
+def nearby_requests(lat, lng, radius_km=None):
+    """{request_id: distance_km} for pending requests within radius_km."""
+    ensure_indexes()
+    radius_km = radius_km or getattr(settings, 'MECHANIC_MATCH_RADIUS_KM', 25)
+    return {key: distance for distance, key, _ in request_index.within(lat, lng, radius_km)}
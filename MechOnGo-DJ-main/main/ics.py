@@ -0,0 +1,148 @@
+"""
+iCalendar (RFC 5545) subscription feeds of a mechanic's jobs.
+
+Calendar apps can't log in, so a feed URL carries a signed token naming the
+mechanic and their current ``calendar_feed_key`` instead of relying on the
+session. Rotating the key revokes every link issued before, and the feed stops
+as soon as the mechanic is deactivated. The owner check is cached briefly, so
+a polling calendar app costs no query. The feed is written row by row from a
+server-side cursor, so memory stays flat however long the history is.
+"""
+import secrets
+from datetime import timezone as dt_timezone
+
+from django.core import signing
+from django.core.cache import cache
+
+from .models import Job, UserProfile
+
+_TOKEN_SALT = 'main.ics.calendar-feed'
+
+# How long a feed owner check is trusted; also bounds how long a deactivation
+# made outside the signals takes to apply.
+_OWNER_TIMEOUT = 5 * 60
+
+# Job statuses and how calendar apps should show them.
+_EVENT_STATUS = {
+    'pending': 'TENTATIVE',
+    'cancelled': 'CANCELLED',
+}
+
+_FEED_FIELDS = (
+    'id', 'status', 'start_time', 'end_time', 'updated_at',
+    'service_request__issue_description', 'service_request__location',
+    'service_request__vehicle_make', 'service_request__vehicle_model', 'service_request__vehicle_year',
+    'service_request__customer__first_name', 'service_request__customer__last_name',
+)
+
+
+def _owner_key(user_id):
+    return f'ics:feed_key:{user_id}'
+
+
+def forget_feed_owner(user_id):
+    """Drop the cached owner check, e.g. after the user or their profile changed."""
+    cache.delete(_owner_key(user_id))
+
+
+def rotate_feed_key(profile):
+    """Give the mechanic a new feed key, revoking their existing links."""
+    profile.calendar_feed_key = secrets.token_hex(16)
+    UserProfile.objects.filter(id=profile.id).update(calendar_feed_key=profile.calendar_feed_key)
+    forget_feed_owner(profile.user_id)
+
+
+def feed_token(profile):
+    if not profile.calendar_feed_key:
+        rotate_feed_key(profile)
+    return signing.Signer(salt=_TOKEN_SALT).sign(f'{profile.user_id}:{profile.calendar_feed_key}')
+
+
+def _current_feed_key(user_id):
+    """The feed key of an active mechanic, or '' if the user may not have a feed."""
+    key = cache.get(_owner_key(user_id))
+    if key is None:
+        key = UserProfile.objects.filter(
+            user_id=user_id, is_mechanic=True, user__is_active=True
+        ).values_list('calendar_feed_key', flat=True).first() or ''
+        cache.set(_owner_key(user_id), key, _OWNER_TIMEOUT)
+    return key
+
+
+def feed_user_id(token):
+    """The mechanic a feed token belongs to, or None if it is forged, revoked or its owner can't have a feed."""
+    try:
+        user_id, key = signing.Signer(salt=_TOKEN_SALT).unsign(token).split(':')
+        user_id = int(user_id)
+    except (signing.BadSignature, ValueError):
+        return None
+    current = _current_feed_key(user_id)
+    if not current or not secrets.compare_digest(current, key):
+        return None
+    return user_id
+
+
+def _escape(text):
+    return (
+        (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _format_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _fold(line):
+    """Split a content line into 75-octet pieces joined by CRLF + space."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    pieces, start = [], 0
+    while start < len(encoded):
+        end = min(start + (75 if not pieces else 74), len(encoded))
+        # Don't cut a multi-byte character in half.
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        pieces.append(encoded[start:end].decode('utf-8'))
+        start = end
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def _event_lines(row, host):
+    (job_id, status, start_time, end_time, updated_at, issue, location,
+     make, model, year, first_name, last_name) = row
+    vehicle = f"{make} {model} ({year})" if make and model and year else ''
+    customer = f"{first_name} {last_name}".strip()
+    description = '\n'.join(filter(None, [
+        f"Customer: {customer}" if customer else '',
+        f"Vehicle: {vehicle}" if vehicle else '',
+        issue or '',
+    ]))
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:job-{job_id}@{host}',
+        f'DTSTAMP:{_format_datetime(updated_at)}',
+        f'LAST-MODIFIED:{_format_datetime(updated_at)}',
+        f'DTSTART:{_format_datetime(start_time)}',
+        f'DTEND:{_format_datetime(end_time)}',
+        f'SUMMARY:{_escape((issue or "Service job")[:80])}',
+        f'DESCRIPTION:{_escape(description)}',
+        f'STATUS:{_EVENT_STATUS.get(status, "CONFIRMED")}',
+    ]
+    if location:
+        lines.append(f'LOCATION:{_escape(location)}')
+    lines.append('END:VEVENT')
+    return lines
+
+
+def mechanic_feed(mechanic_id, host, name='MechOnGO Jobs'):
+    """Yield the mechanic's calendar as CRLF-terminated, folded lines."""
+    header = ('BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//MechOnGO//Jobs//EN',
+              'CALSCALE:GREGORIAN', 'METHOD:PUBLISH', f'X-WR-CALNAME:{_escape(name)}')
+    yield ''.join(map(_fold, header))
+    jobs = Job.objects.filter(mechanic_id=mechanic_id).order_by('start_time').values_list(*_FEED_FIELDS)
+    # One chunk per event keeps the response's per-chunk overhead down.
+    for row in jobs.iterator(chunk_size=500):
+        yield ''.join(map(_fold, _event_lines(row, host)))
+    yield _fold('END:VCALENDAR')
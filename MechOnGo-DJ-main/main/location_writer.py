@@ -0,0 +1,120 @@
+"""
+Write-behind buffer for MechanicLocation rows.
+
+GPS pings arrive far more often than SQLite likes single-row INSERTs, so the
+location consumer hands each accepted ping to the process-wide ``location_writer``
+instead of saving it. Buffered rows are written with one ``bulk_create`` when
+the buffer reaches ``LOCATION_WRITE_BATCH_SIZE`` rows or when the oldest row
+has waited ``LOCATION_WRITE_FLUSH_INTERVAL`` seconds, whichever comes first.
+A batch that fails to write goes back to the front of the buffer and is
+retried on the next flush; if the database stays unavailable the buffer keeps
+only the newest ``LOCATION_WRITE_MAX_BUFFER`` rows.
+"""
+import asyncio
+import atexit
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError
+
+from .models import Job, MechanicLocation
+
+logger = logging.getLogger(__name__)
+
+
+class LocationWriter:
+    def __init__(self, batch_size=None, flush_interval=None, max_buffer=None):
+        self.batch_size = batch_size or getattr(settings, 'LOCATION_WRITE_BATCH_SIZE', 200)
+        self.flush_interval = flush_interval or getattr(settings, 'LOCATION_WRITE_FLUSH_INTERVAL', 2.0)
+        self.max_buffer = max_buffer or getattr(settings, 'LOCATION_WRITE_MAX_BUFFER', 5000)
+        self._buffer = []
+        self._timer = None
+        self._pending = set()
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def add(self, location):
+        """Queue an unsaved MechanicLocation. Must be called from the event loop."""
+        self._buffer.append(location)
+        if len(self._buffer) >= self.batch_size:
+            self._schedule_flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.flush_interval, self._schedule_flush)
+
+    def _schedule_flush(self):
+        # Run the write in the background so the caller never waits on the DB.
+        task = asyncio.ensure_future(self.flush())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def _take_batch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        return batch
+
+    def _requeue(self, batch):
+        """Put a batch that failed to write back in front of newer rows and retry later."""
+        self._buffer = batch + self._buffer
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self.dropped += overflow
+            logger.error(f"Location buffer full; dropped the {overflow} oldest mechanic locations")
+        if self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.flush_interval, self._schedule_flush)
+
+    async def _without_deleted_jobs(self, batch):
+        """Drop rows for jobs deleted since they were buffered; they would fail every retry."""
+        try:
+            job_ids = {location.job_id for location in batch}
+            existing = {job_id async for job_id in Job.objects.filter(id__in=job_ids).values_list('id', flat=True)}
+        except Exception:
+            return batch
+        return [location for location in batch if location.job_id in existing]
+
+    async def flush(self):
+        """Write everything buffered so far. Returns the number of rows written."""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        try:
+            await MechanicLocation.objects.abulk_create(batch, batch_size=self.batch_size)
+        except Exception as e:
+            logger.exception(f"Failed to write {len(batch)} buffered mechanic locations; will retry")
+            if isinstance(e, IntegrityError):
+                batch = await self._without_deleted_jobs(batch)
+            self._requeue(batch)
+            return 0
+        logger.debug(f"Flushed {len(batch)} mechanic locations")
+        return len(batch)
+
+    async def drain(self):
+        """Flush the buffer and wait for background flushes already in flight."""
+        written = await self.flush()
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        return written
+
+    def flush_sync(self):
+        """Flush from synchronous code, e.g. at interpreter shutdown."""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        try:
+            MechanicLocation.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception:
+            logger.exception(f"Failed to write {len(batch)} buffered mechanic locations on shutdown")
+            return 0
+        logger.info(f"Flushed {len(batch)} mechanic locations on shutdown")
+        return len(batch)
+
+
+location_writer = LocationWriter()
+
+atexit.register(location_writer.flush_sync)
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from main.autodispatch import INFEASIBLE, build_cost_matrix, dispatch_pending, solve_assignment
+
+
+class Command(BaseCommand):
+    help = (
+        "Assign pending, geocoded service requests to available mechanics in one "
+        "batch, minimising total distance, specialization mismatch, low ratings "
+        "and current load. Run on demand, from cron, or with --every to loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Print the planned assignments without claiming anything.')
+        parser.add_argument('--every', type=float, default=None,
+                            help='Keep running, one dispatch round every this many seconds.')
+        parser.add_argument('--benchmark', type=int, default=None, metavar='N',
+                            help='Time the optimiser on a random N x N instance instead of dispatching.')
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            self.benchmark(options['benchmark'])
+            return
+
+        while True:
+            self.dispatch_round(options['dry_run'])
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def dispatch_round(self, dry_run):
+        started = time.monotonic()
+        plan, claimed = dispatch_pending(dry_run=dry_run)
+        elapsed = time.monotonic() - started
+        for request_id, mechanic_id, cost in plan:
+            self.stdout.write(f"ServiceRequest {request_id} -> mechanic {mechanic_id} (cost {cost:.1f} km)")
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f"Planned {len(plan)} assignments in {elapsed:.2f}s (dry run)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Assigned {len(claimed)} of {len(plan)} planned requests in {elapsed:.2f}s"
+            ))
+
+    def benchmark(self, n):
+        rng = np.random.default_rng(0)
+        specializations = ['general', 'engine', 'electrical', 'brakes', 'diagnostics']
+        # A city-sized area around a common origin, roughly 40 x 40 km.
+        requests = [
+            (i, 12.9 + rng.uniform(-0.18, 0.18), 77.6 + rng.uniform(-0.18, 0.18), rng.choice(specializations))
+            for i in range(n)
+        ]
+        mechanics = [
+            (i, 12.9 + rng.uniform(-0.18, 0.18), 77.6 + rng.uniform(-0.18, 0.18), rng.choice(specializations),
+             rng.uniform(3, 5), int(rng.integers(0, 3)))
+            for i in range(n)
+        ]
+
+        started = time.perf_counter()
+        cost = build_cost_matrix(requests, mechanics)
+        built = time.perf_counter()
+        rows, cols = solve_assignment(cost)
+        solved = time.perf_counter()
+
+        total = cost[rows, cols]
+        feasible = total < INFEASIBLE
+        self.stdout.write(f"Cost matrix {n}x{n}: {built - started:.3f}s")
+        self.stdout.write(f"Assignment: {solved - built:.3f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"Matched {int(feasible.sum())} of {n} requests, "
+            f"mean cost {total[feasible].mean():.2f} km"
+        ))
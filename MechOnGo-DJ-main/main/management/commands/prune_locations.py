@@ -0,0 +1,93 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from main.models import Job, MechanicLocation, JobLocationSummary
+from main.tracking import compact_job_track, haversine_m
+
+
+def roll_up(summary, rows):
+    """Fold (id, latitude, longitude, timestamp) rows, oldest first, into the job's summary."""
+    previous = None
+    if summary.last_latitude is not None and summary.last_longitude is not None:
+        previous = (summary.last_latitude, summary.last_longitude)
+
+    for _, latitude, longitude, timestamp in rows:
+        if previous is not None:
+            summary.distance_m += haversine_m(previous[0], previous[1], latitude, longitude)
+        previous = (latitude, longitude)
+        if summary.first_timestamp is None or timestamp < summary.first_timestamp:
+            summary.first_timestamp = timestamp
+        if summary.last_timestamp is None or timestamp > summary.last_timestamp:
+            summary.last_timestamp = timestamp
+
+    summary.point_count += len(rows)
+    summary.last_latitude, summary.last_longitude = previous
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact the tracks of completed jobs that still have raw location points, "
+        "then delete raw points older than the retention window, rolling them up "
+        "into per-job summaries first. Works in small batches so SQLite's write "
+        "lock is never held for long."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'LOCATION_RETENTION_DAYS', 30),
+                            help='Delete points older than this many days.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows deleted per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between batches to let other writers in.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        removed = 0
+
+        # Rows that arrived after a job's completion-time compaction, or jobs
+        # whose compaction failed. Compacting keeps their shape in the JobTrack.
+        compacted = 0
+        for job in Job.objects.filter(
+            status='completed', id__in=MechanicLocation.objects.values('job_id')
+        ).iterator():
+            compact_job_track(job)
+            compacted += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        job_ids = list(
+            MechanicLocation.objects.filter(timestamp__lt=cutoff)
+            .values_list('job_id', flat=True).distinct()
+        )
+        for job_id in job_ids:
+            while True:
+                with transaction.atomic():
+                    rows = list(
+                        MechanicLocation.objects.filter(job_id=job_id, timestamp__lt=cutoff)
+                        .order_by('timestamp', 'id')
+                        .values_list('id', 'latitude', 'longitude', 'timestamp')[:batch_size]
+                    )
+                    if not rows:
+                        break
+                    summary, _ = JobLocationSummary.objects.get_or_create(job_id=job_id)
+                    roll_up(summary, rows)
+                    summary.save()
+                    MechanicLocation.objects.filter(id__in=[row[0] for row in rows]).delete()
+                removed += len(rows)
+                if len(rows) < batch_size:
+                    break
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {compacted} completed job tracks; removed {removed} location rows "
+            f"older than {options['days']} days across {len(job_ids)} jobs in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 03:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_remove_paymentmethod_last_four_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobTrack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encoded_points', models.BinaryField()),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('raw_point_count', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='track', to='main.job')),
+            ],
+        ),
+    ]
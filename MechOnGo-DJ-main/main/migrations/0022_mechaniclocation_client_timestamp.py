@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 03:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_location_retention'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mechaniclocation',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 03:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_mechaniclocation_client_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='base_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='base_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
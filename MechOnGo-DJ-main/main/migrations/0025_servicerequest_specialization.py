@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0024_geocodecache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicerequest',
+            name='specialization',
+            field=models.CharField(choices=[('general', 'General Mechanic'), ('engine', 'Engine Specialist'), ('electrical', 'Electrical Systems'), ('brakes', 'Brakes & Suspension'), ('diagnostics', 'Diagnostics')], default='general', max_length=50),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 03:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0028_servicerequest_board_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['mechanic', 'start_time'], name='job_mechanic_start_idx'),
+        ),
+    ]
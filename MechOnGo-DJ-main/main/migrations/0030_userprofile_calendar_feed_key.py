@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0029_job_mechanic_start_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='calendar_feed_key',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
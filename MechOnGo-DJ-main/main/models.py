@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
@@ -6,6 +8,7 @@ from django.utils import timezone
 from django.core.validators import RegexValidator
 from datetime import timedelta
 import uuid
+from .polyline import decode_track
 
 class UserProfile(models.Model):
     SPECIALIZATION_CHOICES = [
@@ -35,6 +38,11 @@ class UserProfile(models.Model):
     hourly_rate = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     certifications = models.TextField(blank=True, null=True)
     is_approved = models.BooleanField(default=False)
+    # Home base, used to match the mechanic with nearby requests
+    base_latitude = models.FloatField(blank=True, null=True)
+    base_longitude = models.FloatField(blank=True, null=True)
+    # Part of the signed calendar feed URL; changing it revokes old links
+    calendar_feed_key = models.CharField(max_length=32, blank=True)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
@@ -66,6 +74,8 @@ class ServiceRequest(models.Model):
     customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='service_requests')
     mechanic = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_requests')
     issue_description = models.TextField(blank=True, null=True)
+    # Routes the request to mechanics with a matching specialization
+    specialization = models.CharField(max_length=50, choices=UserProfile.SPECIALIZATION_CHOICES, default='general')
     vehicle_type = models.CharField(max_length=100, blank=True, null=True)
     vehicle_make = models.CharField(max_length=50, blank=True, null=True)
     vehicle_model = models.CharField(max_length=50, blank=True, null=True)
@@ -77,11 +87,21 @@ class ServiceRequest(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
+    # Fallback copy of the live OTP; reads go through main.otp and its cache.
     otp = models.CharField(max_length=8, null=True, blank=True)
     otp_created_at = models.DateTimeField(null=True, blank=True)
     location = models.CharField(max_length=255, blank=True, null=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
     additional_notes = models.TextField(blank=True)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES, default='cash')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the request board: seek by status, walk (created_at, id).
+            models.Index(fields=['status', 'created_at', 'id'], name='servicerequest_board_idx'),
+        ]
 
     def __str__(self):
         return f"Service Request #{self.id} for {self.customer.username}"
@@ -97,6 +117,10 @@ class Job(models.Model):
         ('cancelled', 'Cancelled'),
     ]
 
+    # Longest a job may run. Enforced on save, so date-windowed queries can
+    # bound start_time from below as well as above.
+    MAX_DURATION = timedelta(days=getattr(settings, 'JOB_MAX_DURATION_DAYS', 7))
+
     service_request = models.ForeignKey(ServiceRequest, on_delete=models.CASCADE, related_name='jobs')
     mechanic = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     start_time = models.DateTimeField()
@@ -105,10 +129,26 @@ class Job(models.Model):
     rating = models.FloatField(null=True, blank=True)
     comments = models.TextField(blank=True, null=True)  # Added null=True
     completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Date-windowed calendar queries for one mechanic.
+            models.Index(fields=['mechanic', 'start_time'], name='job_mechanic_start_idx'),
+        ]
 
     def __str__(self):
         return f"Job #{self.id} for {self.service_request.customer.username}"
 
+    def clean(self):
+        super().clean()
+        if self.start_time and self.end_time and self.end_time - self.start_time > self.MAX_DURATION:
+            raise ValidationError({'end_time': f"A job can't run longer than {self.MAX_DURATION.days} days."})
+
+    def save(self, *args, **kwargs):
+        self.clean()
+        super().save(*args, **kwargs)
+
 
 class Invoice(models.Model):
     STATUS_CHOICES = [('pending', 'Pending'), ('paid', 'Paid'), ('overdue', 'Overdue')]
@@ -154,12 +194,85 @@ class MechanicLocation(models.Model):
     job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='mechanic_locations')
     latitude = models.FloatField()
     longitude = models.FloatField()
-    timestamp = models.DateTimeField(auto_now=True)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
 
     def __str__(self):
         return f"Location for {self.mechanic.username} at {self.timestamp}"
 
 
+class JobTrack(models.Model):
+    """Simplified, delta-encoded track that replaces a completed job's raw MechanicLocation rows."""
+    job = models.OneToOneField(Job, on_delete=models.CASCADE, related_name='track')
+    encoded_points = models.BinaryField()
+    point_count = models.PositiveIntegerField(default=0)
+    raw_point_count = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Track for Job #{self.job_id} ({self.point_count} points)"
+
+    @property
+    def points(self):
+        return decode_track(self.encoded_points)
+
+
+class JobLocationSummary(models.Model):
+    """Rollup of MechanicLocation rows removed by the prune_locations retention command."""
+    job = models.OneToOneField(Job, on_delete=models.CASCADE, related_name='location_summary')
+    point_count = models.PositiveIntegerField(default=0)
+    distance_m = models.FloatField(default=0)
+    first_timestamp = models.DateTimeField(null=True, blank=True)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    last_latitude = models.FloatField(null=True, blank=True)
+    last_longitude = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Location summary for Job #{self.job_id}"
+
+    @property
+    def duration(self):
+        if self.first_timestamp and self.last_timestamp:
+            return self.last_timestamp - self.first_timestamp
+        return timedelta(0)
+
+
+class GeocodeCache(models.Model):
+    """Persistent geocoding results keyed by normalized address. Null coordinates mean "not found"."""
+    query = models.CharField(max_length=255, unique=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    provider = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.query
+
+
+class UserStats(models.Model):
+    """
+    Dashboard counters for one user, kept current by main.stats. A customer's
+    row counts the jobs they booked, a mechanic's the jobs assigned to them.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    active_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    next_appointment = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for {self.user.username}"
+
+    @property
+    def average_rating(self):
+        return round(self.rating_sum / self.rating_count, 1) if self.rating_count else 0.0
+
+
 # Signal to create or update user profile
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
@@ -0,0 +1,150 @@
+"""
+Job start/complete OTPs.
+
+Live codes and attempt counters sit in the shared cache under a TTL, so an
+expired code simply disappears and dashboards fetch every code they show with
+one get_many. Requests without a code are cached as a NO_CODE marker, so the
+database is only asked about ids the cache has lost. The ServiceRequest's
+otp/otp_created_at columns are written alongside as that fallback, and the
+conditional UPDATE that clears them is what makes consuming a code atomic.
+"""
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .customer_events import publish_bookings_changed
+from .models import ServiceRequest
+from .sharedcache import shared_cache as cache
+from .versions import bump_user_versions
+
+OTP_TTL = timedelta(seconds=getattr(settings, 'OTP_TTL_SECONDS', 300))
+OTP_MAX_ATTEMPTS = getattr(settings, 'OTP_MAX_ATTEMPTS', 5)
+
+_ACTION_CODES = {'start': 'S', 'complete': 'C'}
+_CODE_ACTIONS = {code: action for action, code in _ACTION_CODES.items()}
+
+# verify_and_consume outcomes
+VERIFIED = 'verified'
+NO_OTP = 'no_otp'
+WRONG_CODE = 'wrong_code'
+WRONG_ACTION = 'wrong_action'
+TOO_MANY_ATTEMPTS = 'too_many_attempts'
+
+# Cached for requests known to have no live code; issue_otp overwrites it.
+NO_CODE = 'none'
+
+
+def _otp_key(request_id):
+    return f'otp:request:{request_id}'
+
+
+def _attempts_key(request_id):
+    return f'otp:attempts:{request_id}'
+
+
+def _entry(code, action, created_at):
+    return {'otp': code, 'action': action, 'expires_at': created_at + OTP_TTL}
+
+
+def _remaining_seconds(entry):
+    return int((entry['expires_at'] - timezone.now()).total_seconds())
+
+
+def issue_otp(service_request, action):
+    """Generate a fresh code for `action` ('start' or 'complete'), replacing any earlier one."""
+    code = f'{secrets.randbelow(10 ** 6):06d}'
+    created_at = timezone.now()
+    ServiceRequest.objects.filter(id=service_request.id).update(
+        otp=f'{code}-{_ACTION_CODES[action]}', otp_created_at=created_at, updated_at=created_at
+    )
+    entry = _entry(code, action, created_at)
+    cache.set(_otp_key(service_request.id), entry, _remaining_seconds(entry))
+    cache.delete(_attempts_key(service_request.id))
+    # .update() skips the signals that usually announce the change.
+    user_ids = (service_request.customer_id, service_request.mechanic_id)
+    transaction.on_commit(lambda: bump_user_versions(*user_ids))
+    publish_bookings_changed(service_request.customer_id)
+    return code
+
+
+def _from_row(otp, created_at):
+    try:
+        code, action_code = otp.split('-')
+        return _entry(code, _CODE_ACTIONS[action_code], created_at)
+    except (ValueError, KeyError):
+        return None
+
+
+def active_otps(request_ids):
+    """
+    {request_id: {'otp', 'action', 'expires_at'}} for the requests that have a
+    live code. One cache call, plus one query for ids the cache doesn't know.
+    """
+    request_ids = set(request_ids)
+    if not request_ids:
+        return {}
+    keys = {_otp_key(request_id): request_id for request_id in request_ids}
+    found = {keys[key]: entry for key, entry in cache.get_many(keys.keys()).items()}
+
+    missing = request_ids - found.keys()
+    if missing:
+        rows = ServiceRequest.objects.filter(
+            id__in=missing, otp__isnull=False, otp_created_at__gt=timezone.now() - OTP_TTL
+        ).values_list('id', 'otp', 'otp_created_at')
+        for request_id, otp, created_at in rows:
+            entry = _from_row(otp, created_at)
+            if entry:
+                found[request_id] = entry
+        for request_id in missing:
+            entry = found.get(request_id, NO_CODE)
+            timeout = _remaining_seconds(entry) if entry != NO_CODE else OTP_TTL.total_seconds()
+            # add, not set: a code issued since the query above must win.
+            cache.add(_otp_key(request_id), entry, max(1, int(timeout)))
+
+    now = timezone.now()
+    return {
+        request_id: entry for request_id, entry in found.items()
+        if entry != NO_CODE and entry['expires_at'] > now
+    }
+
+
+def active_otp(request_id):
+    return active_otps([request_id]).get(request_id)
+
+
+def verify_and_consume(service_request, code, action):
+    """
+    Check `code` for `action` and use it up. Every call counts as an attempt;
+    after OTP_MAX_ATTEMPTS the code is locked until a new one is issued. Only
+    one caller can consume a given code. Call inside the transaction that acts
+    on the result, so a rollback leaves the code usable.
+    """
+    request_id = service_request.id
+    cache.add(_attempts_key(request_id), 0, int(OTP_TTL.total_seconds()))
+    try:
+        attempts = cache.incr(_attempts_key(request_id))
+    except ValueError:
+        # Expired between add and incr; this is the first attempt of a new window.
+        cache.set(_attempts_key(request_id), 1, int(OTP_TTL.total_seconds()))
+        attempts = 1
+    if attempts > OTP_MAX_ATTEMPTS:
+        return TOO_MANY_ATTEMPTS
+
+    entry = active_otp(request_id)
+    if entry is None:
+        return NO_OTP
+    if code != entry['otp']:
+        return WRONG_CODE
+    if action != entry['action']:
+        return WRONG_ACTION
+
+    consumed = ServiceRequest.objects.filter(
+        id=request_id,
+        otp=f"{entry['otp']}-{_ACTION_CODES[action]}",
+        otp_created_at__gt=timezone.now() - OTP_TTL,
+    ).update(otp=None, otp_created_at=None, updated_at=timezone.now())
+    transaction.on_commit(lambda: cache.delete_many([_otp_key(request_id), _attempts_key(request_id)]))
+    return VERIFIED if consumed else NO_OTP
@@ -0,0 +1,48 @@
+"""
+Keyset (cursor) pagination, newest first.
+
+A page is "the next N rows before this (created_at, id)". The database
+answers that by seeking into an index on the ordering columns instead of
+walking past OFFSET rows, so the last page of a long backlog costs the same
+as the first, and rows created while a client scrolls don't shift its pages.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    """An opaque position token: microseconds since the epoch and the row id."""
+    return f'{(created_at - _EPOCH) // _MICROSECOND}.{pk}'
+
+
+def decode_cursor(cursor):
+    try:
+        micros, pk = cursor.split('.')
+        return _EPOCH + int(micros) * _MICROSECOND, int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+
+
+def keyset_page(queryset, cursor=None, page_size=20):
+    """
+    One page of `queryset` ordered by (-created_at, -id), starting after
+    `cursor`. Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    # One extra row tells us whether another page exists without a COUNT.
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
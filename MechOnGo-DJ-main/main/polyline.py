@@ -0,0 +1,114 @@
+"""
+Compact storage for mechanic tracks.
+
+Completed jobs keep a single simplified track instead of one MechanicLocation
+row per ping. Points are simplified with Douglas-Peucker, then stored as
+zigzag/varint-encoded deltas of (lat * 1e5, lng * 1e5, unix seconds).
+``to_google_polyline`` produces the standard encoded polyline string that map
+libraries understand.
+"""
+import math
+
+PRECISION = 1e5
+
+
+def _perpendicular_distance_m(point, start, end):
+    # Equirectangular projection is accurate enough at street scale.
+    lat0 = math.radians(start[0])
+    x = lambda p: math.radians(p[1]) * math.cos(lat0) * 6371000
+    y = lambda p: math.radians(p[0]) * 6371000
+    px, py = x(point), y(point)
+    sx, sy = x(start), y(start)
+    ex, ey = x(end), y(end)
+    dx, dy = ex - sx, ey - sy
+    if dx == 0 and dy == 0:
+        return math.hypot(px - sx, py - sy)
+    t = max(0.0, min(1.0, ((px - sx) * dx + (py - sy) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - (sx + t * dx), py - (sy + t * dy))
+
+
+def simplify(points, tolerance_m=10):
+    """
+    Douglas-Peucker simplification of [(lat, lng, ...), ...] with a tolerance
+    in metres. Iterative so long tracks don't hit the recursion limit.
+    """
+    if len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_distance, index = 0.0, None
+        for i in range(first + 1, last):
+            distance = _perpendicular_distance_m(points[i], points[first], points[last])
+            if distance > max_distance:
+                max_distance, index = distance, i
+        if index is not None and max_distance > tolerance_m:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def _write_varint(out, value):
+    value = (value << 1) ^ (value >> 63)  # zigzag
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1), pos
+
+
+def encode_track(points):
+    """Encode [(lat, lng, unix_seconds), ...] into a compact blob."""
+    out = bytearray()
+    previous = (0, 0, 0)
+    for lat, lng, ts in points:
+        current = (round(lat * PRECISION), round(lng * PRECISION), int(ts))
+        for value, last in zip(current, previous):
+            _write_varint(out, value - last)
+        previous = current
+    return bytes(out)
+
+
+def decode_track(data):
+    """Inverse of encode_track."""
+    data = bytes(data)
+    points = []
+    values = [0, 0, 0]
+    pos = 0
+    while pos < len(data):
+        for i in range(3):
+            delta, pos = _read_varint(data, pos)
+            values[i] += delta
+        points.append((values[0] / PRECISION, values[1] / PRECISION, values[2]))
+    return points
+
+
+def to_google_polyline(points):
+    """Encode [(lat, lng, ...), ...] in Google's encoded polyline format."""
+    chunks = []
+    previous_lat = previous_lng = 0
+    for point in points:
+        lat, lng = round(point[0] * PRECISION), round(point[1] * PRECISION)
+        for delta in (lat - previous_lat, lng - previous_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous_lat, previous_lng = lat, lng
+    return ''.join(chunks)
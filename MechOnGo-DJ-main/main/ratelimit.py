@@ -0,0 +1,152 @@
+"""
+Per-route rate limiting in the cache.
+
+Each (route, rule, key) pair gets a token bucket, implemented as GCRA: the
+cache holds the bucket's "theoretical arrival time" in milliseconds and every
+request pushes it forward by one emission interval with an atomic incr, whose
+result alone decides the request. A request is refused when that time runs
+more than a full bucket ahead of now. Refilling needs no write of its own: the
+key expires about when the bucket is full again, and the next request re-seeds
+it with an atomic add. No database access is involved, so a refused request
+costs a few cache calls and a tiny 429 response.
+
+Buckets live in the RATE_LIMIT_CACHE alias, which must be shared by all
+workers (e.g. Redis) for the limits to hold across processes. If that cache
+is unreachable, requests are let through rather than failing.
+
+Rules come from settings.RATE_LIMITS, e.g.::
+
+    RATE_LIMITS = {
+        'login': [{'key': 'ip', 'rate': '10/m'}],
+        'verify_otp': [{'key': 'user', 'rate': '30/m'}, {'key': 'service_request', 'rate': '10/m'}],
+    }
+
+A rate of "N/period" allows bursts of N and refills at N per period. Keys are
+"ip", "user" (the IP for anonymous users) or "service_request" (the view's
+service_request_id argument).
+"""
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60): requests allowed per period in seconds."""
+    count, period = rate.split('/')
+    return int(count), _PERIODS[period[0].lower()]
+
+
+def _client_ip(request):
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def _key_value(kind, request, view_kwargs):
+    if kind == 'ip':
+        return f'ip:{_client_ip(request)}'
+    if kind == 'user':
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.id}'
+        return f'ip:{_client_ip(request)}'
+    if kind == 'service_request':
+        request_id = view_kwargs.get('service_request_id')
+        return f'sr:{request_id}' if request_id is not None else None
+    raise ValueError(f"Unknown rate limit key {kind!r}")
+
+
+class RateLimiter:
+    """GCRA buckets in the cache, plus per-route counters kept in process memory."""
+
+    def __init__(self):
+        self._counters = {}
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+    def rules(self, route):
+        return getattr(settings, 'RATE_LIMITS', {}).get(route, [])
+
+    def consume(self, bucket, rate):
+        """Take one token from `bucket`. Returns 0 if allowed, else the seconds until a token is free."""
+        limit, period = parse_rate(rate)
+        interval = max(1, int(period * 1000 / limit))
+        capacity = interval * limit
+        now = int(time.time() * 1000)
+        cache = self.cache
+        key = f'ratelimit:{bucket}'
+
+        for _ in range(2):
+            cache.add(key, now, period + 1)
+            try:
+                tat = cache.incr(key, interval)
+                break
+            except ValueError:
+                # The bucket expired between add and incr: seed it again.
+                continue
+        else:
+            return 0
+
+        if tat - now > capacity:
+            cache.decr(key, interval)  # A refused request doesn't use up a token.
+            return math.ceil((tat - capacity - now) / 1000)
+        # Expire once the bucket has refilled, so the next request starts from
+        # now. The second of rounding is the only slack in the refill.
+        cache.touch(key, max(1, math.ceil((tat - now) / 1000)))
+        return 0
+
+    def check(self, route, request, view_kwargs):
+        """Seconds the client must wait before retrying `route`, or 0 if the request may proceed."""
+        counters = self._counters.setdefault(route, {'allowed': 0, 'limited': 0})
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+            counters['allowed'] += 1
+            return 0
+        for index, rule in enumerate(self.rules(route)):
+            key = _key_value(rule['key'], request, view_kwargs)
+            if key is None:
+                continue
+            try:
+                retry_after = self.consume(f'{route}:{index}:{key}', rule['rate'])
+            except Exception:
+                logger.warning(f"Rate limit cache unavailable for {route}; allowing request", exc_info=True)
+                counters['errors'] = counters.get('errors', 0) + 1
+                retry_after = 0
+            if retry_after:
+                counters['limited'] += 1
+                return retry_after
+        counters['allowed'] += 1
+        return 0
+
+    def stats(self):
+        return {route: dict(counters) for route, counters in self._counters.items()}
+
+
+rate_limiter = RateLimiter()
+
+
+def rate_limit(route, methods=('POST',)):
+    """Refuse requests to the decorated view with 429 once `route`'s limits are exceeded."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method in methods:
+                retry_after = rate_limiter.check(route, request, kwargs)
+                if retry_after:
+                    logger.info(f"Rate limited {route} for {_client_ip(request)} (retry in {retry_after}s)")
+                    response = JsonResponse(
+                        {'success': False, 'message': 'Too many requests. Please try again shortly.'}, status=429
+                    )
+                    response['Retry-After'] = str(retry_after)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
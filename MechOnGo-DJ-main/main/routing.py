@@ -3,4 +3,7 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/mechanic/location/(?P<mechanic_id>\d+)/$', consumers.MechanicLocationConsumer.as_asgi()),
+    re_path(r'ws/mechanic/feed/$', consumers.MechanicFeedConsumer.as_asgi()),
+    re_path(r'ws/customer/events/$', consumers.CustomerEventsConsumer.as_asgi()),
+    re_path(r'ws/location/(?P<job_id>\d+)/$', consumers.JobLocationConsumer.as_asgi()),
 ]
\ No newline at end of file
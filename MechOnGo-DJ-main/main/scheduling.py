@@ -0,0 +1,250 @@
+"""
+In-process index of when each mechanic is busy.
+
+Every mechanic has a ``MechanicSchedule``: the start and end times of
+their active jobs (scheduled, en route or in progress) kept sorted by start,
+plus a running maximum of the end times. "Does [start, end) overlap anything?"
+is then one binary search, and "who is free from 14:00 to 16:00?" is one
+binary search per mechanic instead of a scan over every job.
+
+Like ``main.geoindex``, the index is built lazily from the database, kept
+current by ``claim_service_request`` and the Job/UserProfile signals, and
+rebuilt every ``SCHEDULE_REFRESH_SECONDS`` to pick up other workers' writes.
+"""
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .feed import GENERAL
+from .models import Job, UserProfile
+
+ACTIVE_JOB_STATUSES = ['scheduled', 'en_route', 'in_progress']
+
+# Length of a booking until a mechanic sets the real end time.
+DEFAULT_JOB_DURATION = timedelta(hours=2)
+
+
+class MechanicSchedule:
+    """One mechanic's busy intervals, sorted by start."""
+
+    def __init__(self, specialization=None, approved=True):
+        self.specialization = specialization or GENERAL
+        self.approved = approved
+        self._starts = []
+        self._ends = []
+        self._job_ids = []
+        self._max_ends = []
+
+    def __len__(self):
+        return len(self._job_ids)
+
+    def _reindex(self, index):
+        running = self._max_ends[index - 1] if index else None
+        del self._max_ends[index:]
+        for end in self._ends[index:]:
+            running = end if running is None or end > running else running
+            self._max_ends.append(running)
+
+    def add(self, job_id, start, end):
+        self.remove(job_id)
+        index = bisect.bisect_right(self._starts, start)
+        self._starts.insert(index, start)
+        self._ends.insert(index, end)
+        self._job_ids.insert(index, job_id)
+        self._reindex(index)
+
+    def remove(self, job_id):
+        try:
+            index = self._job_ids.index(job_id)
+        except ValueError:
+            return
+        del self._starts[index], self._ends[index], self._job_ids[index]
+        self._reindex(index)
+
+    def is_free(self, start, end):
+        """True if no busy interval overlaps [start, end)."""
+        # Only intervals starting before `end` can overlap; of those, the
+        # latest-ending one decides.
+        index = bisect.bisect_left(self._starts, end)
+        return index == 0 or self._max_ends[index - 1] <= start
+
+    def busy(self, start, end):
+        """Busy (start, end) intervals overlapping [start, end), merged."""
+        merged = []
+        index = bisect.bisect_left(self._starts, end)
+        for busy_start, busy_end in zip(self._starts[:index], self._ends[:index]):
+            if busy_end <= start:
+                continue
+            if merged and busy_start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], busy_end))
+            else:
+                merged.append((busy_start, busy_end))
+        return merged
+
+
+class ScheduleIndex:
+    def __init__(self):
+        self._schedules = {}
+        self._job_mechanic = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._schedules)
+
+    def replace_all(self, mechanics, jobs):
+        """mechanics: [(mechanic_id, specialization, approved)], jobs: [(job_id, mechanic_id, start, end)]."""
+        schedules = {
+            mechanic_id: MechanicSchedule(specialization, approved)
+            for mechanic_id, specialization, approved in mechanics
+        }
+        job_mechanic = {}
+        for job_id, mechanic_id, start, end in sorted(jobs, key=lambda job: job[2]):
+            schedule = schedules.get(mechanic_id)
+            if schedule is not None:
+                schedule.add(job_id, start, end)
+                job_mechanic[job_id] = mechanic_id
+        with self._lock:
+            self._schedules, self._job_mechanic = schedules, job_mechanic
+
+    def set_mechanic(self, mechanic_id, specialization, approved):
+        with self._lock:
+            schedule = self._schedules.get(mechanic_id)
+            if schedule is None:
+                self._schedules[mechanic_id] = MechanicSchedule(specialization, approved)
+            else:
+                schedule.specialization, schedule.approved = specialization or GENERAL, approved
+
+    def remove_mechanic(self, mechanic_id):
+        with self._lock:
+            self._schedules.pop(mechanic_id, None)
+
+    def add_job(self, mechanic_id, job_id, start, end):
+        with self._lock:
+            self._remove_job(job_id)
+            schedule = self._schedules.get(mechanic_id)
+            if schedule is not None:
+                schedule.add(job_id, start, end)
+                self._job_mechanic[job_id] = mechanic_id
+
+    def remove_job(self, job_id):
+        with self._lock:
+            self._remove_job(job_id)
+
+    def _remove_job(self, job_id):
+        schedule = self._schedules.get(self._job_mechanic.pop(job_id, None))
+        if schedule is not None:
+            schedule.remove(job_id)
+
+    def is_free(self, mechanic_id, start, end):
+        """Whether the mechanic can take [start, end). Mechanics not in the index are never free."""
+        with self._lock:
+            schedule = self._schedules.get(mechanic_id)
+            return schedule is not None and schedule.is_free(start, end)
+
+    def conflicts(self, mechanic_id, start, end):
+        """Whether [start, end) overlaps one of the mechanic's active jobs."""
+        with self._lock:
+            schedule = self._schedules.get(mechanic_id)
+            return schedule is not None and not schedule.is_free(start, end)
+
+    def available(self, start, end, specialization=None):
+        """Ids of the approved mechanics free for the whole of [start, end) who can handle the specialization."""
+        with self._lock:
+            return [
+                mechanic_id for mechanic_id, schedule in self._schedules.items()
+                if schedule.approved
+                and (not specialization or specialization == GENERAL
+                    or schedule.specialization in (specialization, GENERAL))
+                and schedule.is_free(start, end)
+            ]
+
+    def busy(self, mechanic_id, start, end):
+        with self._lock:
+            schedule = self._schedules.get(mechanic_id)
+            return schedule.busy(start, end) if schedule is not None else []
+
+
+schedule_index = ScheduleIndex()
+_built_at = None
+_build_lock = threading.Lock()
+
+
+def _refresh_seconds():
+    return getattr(settings, 'SCHEDULE_REFRESH_SECONDS', 300)
+
+
+def rebuild_schedule():
+    global _built_at
+    schedule_index.replace_all(
+        UserProfile.objects.filter(is_mechanic=True).values_list('user_id', 'specialization', 'is_approved'),
+        Job.objects.filter(
+            mechanic__isnull=False, status__in=ACTIVE_JOB_STATUSES,
+        ).values_list('id', 'mechanic_id', 'start_time', 'end_time'),
+    )
+    _built_at = time.monotonic()
+
+
+def ensure_schedule():
+    if _built_at is None or time.monotonic() - _built_at > _refresh_seconds():
+        with _build_lock:
+            if _built_at is None or time.monotonic() - _built_at > _refresh_seconds():
+                rebuild_schedule()
+
+
+def index_job(job):
+    """Add, move or drop a job after it was saved."""
+    if job.mechanic_id and job.status in ACTIVE_JOB_STATUSES:
+        schedule_index.add_job(job.mechanic_id, job.id, job.start_time, job.end_time)
+    else:
+        schedule_index.remove_job(job.id)
+
+
+def index_mechanic_schedule(profile):
+    """Track a mechanic's specialization and approval after their profile changed."""
+    if profile.is_mechanic:
+        schedule_index.set_mechanic(profile.user_id, profile.specialization, profile.is_approved)
+    else:
+        schedule_index.remove_mechanic(profile.user_id)
+
+
+def available_mechanics(start, end, specialization=None):
+    ensure_schedule()
+    return schedule_index.available(start, end, specialization)
+
+
+def has_conflict(mechanic_id, start, end):
+    """
+    Whether the index thinks [start, end) clashes with the mechanic's jobs.
+    Only a hint for display: the index can lag other workers, so writes check
+    the database (see claim_service_request).
+    """
+    ensure_schedule()
+    return schedule_index.conflicts(mechanic_id, start, end)
+
+
+def free_slots(start_date, days=2, duration=DEFAULT_JOB_DURATION, specialization=None, limit=8):
+    """
+    Upcoming hourly start times within business hours at which at least one
+    suitable mechanic is free for ``duration``, as [(start, free_mechanic_count)].
+    """
+    ensure_schedule()
+    first_hour = getattr(settings, 'BOOKING_FIRST_HOUR', 8)
+    last_hour = getattr(settings, 'BOOKING_LAST_HOUR', 20)
+    now = timezone.now()
+    slots = []
+    for day in range(days):
+        date = start_date + timedelta(days=day)
+        for hour in range(first_hour, last_hour - int(duration.total_seconds() // 3600) + 1):
+            start = timezone.make_aware(datetime(date.year, date.month, date.day, hour), timezone.get_default_timezone())
+            if start <= now:
+                continue
+            free = len(schedule_index.available(start, start + duration, specialization))
+            if free:
+                slots.append((start, free))
+                if len(slots) >= limit:
+                    return slots
+    return slots
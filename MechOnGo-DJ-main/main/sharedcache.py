@@ -0,0 +1,13 @@
+"""
+The cache every worker process sees.
+
+State that one worker writes and another reads (live positions, per-user
+versions, rendered fragments, OTPs) lives in the ``shared`` cache alias,
+Redis in settings, rather than the process-local default.
+"""
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+SHARED_CACHE_ALIAS = 'shared'
+
+shared_cache = ConnectionProxy(caches, SHARED_CACHE_ALIAS)
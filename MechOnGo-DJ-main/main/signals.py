@@ -0,0 +1,98 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .customer_events import publish_bookings_changed
+from .feed import publish_request_closed
+from .geoindex import index_mechanic, index_request
+from .ics import forget_feed_owner
+from .models import UserProfile, ServiceRequest, Job, Invoice
+from .scheduling import index_job, index_mechanic_schedule, schedule_index
+from .stats import apply_job_change, job_snapshot, job_state
+from .versions import bump_user_versions
+
+
+def _customer_id(job):
+    if Job.service_request.is_cached(job):
+        return job.service_request.customer_id
+    return ServiceRequest.objects.filter(id=job.service_request_id).values_list('customer_id', flat=True).first()
+
+
+@receiver(post_save, sender=UserProfile)
+def update_mechanic_index(sender, instance, **kwargs):
+    index_mechanic(instance)
+    index_mechanic_schedule(instance)
+
+
+@receiver(post_save, sender=UserProfile)
+def recheck_feed_owner_profile(sender, instance, **kwargs):
+    forget_feed_owner(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def recheck_feed_owner(sender, instance, **kwargs):
+    forget_feed_owner(instance.id)
+
+
+@receiver(pre_save, sender=ServiceRequest)
+def remember_request_open(sender, instance, **kwargs):
+    instance._was_open = instance.pk is not None and ServiceRequest.objects.filter(
+        id=instance.pk, status='pending', mechanic=None
+    ).exists()
+
+
+@receiver(post_save, sender=ServiceRequest)
+def update_request_index(sender, instance, created, **kwargs):
+    index_request(instance)
+    # Only the save that takes a request off the board withdraws it.
+    if getattr(instance, '_was_open', False) and (instance.status != 'pending' or instance.mechanic_id is not None):
+        publish_request_closed(instance.id, instance.specialization)
+
+
+@receiver(post_save, sender=ServiceRequest)
+def bump_request_versions(sender, instance, **kwargs):
+    user_ids = (instance.customer_id, instance.mechanic_id)
+    transaction.on_commit(lambda: bump_user_versions(*user_ids))
+    publish_bookings_changed(instance.customer_id)
+
+
+@receiver(post_save, sender=Job)
+def update_schedule_index(sender, instance, **kwargs):
+    index_job(instance)
+
+
+@receiver(post_save, sender=Job)
+def bump_job_versions(sender, instance, **kwargs):
+    customer_id = _customer_id(instance)
+    user_ids = (customer_id, instance.mechanic_id)
+    transaction.on_commit(lambda: bump_user_versions(*user_ids))
+    publish_bookings_changed(customer_id)
+
+
+@receiver(post_save, sender=Invoice)
+def bump_invoice_versions(sender, instance, **kwargs):
+    mechanic_id = Job.objects.filter(id=instance.job_id).values_list('mechanic_id', flat=True).first()
+    user_ids = (instance.user_id, mechanic_id)
+    transaction.on_commit(lambda: bump_user_versions(*user_ids))
+    publish_bookings_changed(instance.user_id)
+
+
+@receiver(post_delete, sender=Job)
+def drop_from_schedule_index(sender, instance, **kwargs):
+    schedule_index.remove_job(instance.id)
+
+
+@receiver(pre_save, sender=Job)
+def remember_job_stats_state(sender, instance, **kwargs):
+    instance._stats_before = job_snapshot(instance.pk)
+
+
+@receiver(post_save, sender=Job)
+def update_job_stats(sender, instance, **kwargs):
+    apply_job_change(getattr(instance, '_stats_before', None), job_state(instance, _customer_id(instance)))
+
+
+@receiver(post_delete, sender=Job)
+def remove_job_stats(sender, instance, **kwargs):
+    apply_job_change(job_state(instance, _customer_id(instance)), None)
@@ -0,0 +1,185 @@
+"""
+Denormalized dashboard counters.
+
+Dashboards read one UserStats row by primary key instead of counting and
+averaging a user's jobs on every view. Rows are adjusted by the difference
+between a job's state before and after each write (Job signals, and
+``claim_service_request`` for its bulk update), inside the writer's
+transaction. A missing row is computed from the jobs on first read, and
+``manage.py rebuild_user_stats`` recomputes every row from scratch.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Min, Q, Sum
+from django.utils import timezone
+
+from .models import Job, UserStats
+
+# Jobs counted as "active bookings" on the dashboards.
+ACTIVE_BOOKING_STATUSES = ['pending', 'scheduled', 'in_progress']
+
+# Jobs that can be someone's next appointment.
+UPCOMING_JOB_STATUSES = ['pending', 'scheduled']
+
+_SNAPSHOT_FIELDS = ('service_request__customer_id', 'mechanic_id', 'status', 'rating', 'start_time')
+
+
+def job_snapshot(job_id):
+    """The stats-relevant state of a job as stored in the database, or None."""
+    if job_id is None:
+        return None
+    row = Job.objects.filter(id=job_id).values_list(*_SNAPSHOT_FIELDS).first()
+    return job_stats_state(*row) if row else None
+
+
+def job_stats_state(customer_id, mechanic_id, status, rating, start_time):
+    return {
+        'customer_id': customer_id,
+        'mechanic_id': mechanic_id,
+        'status': status,
+        'rating': rating,
+        'start_time': start_time,
+    }
+
+
+def job_state(job, customer_id):
+    return job_stats_state(customer_id, job.mechanic_id, job.status, job.rating, job.start_time)
+
+
+def _contribution(state):
+    completed = state['status'] == 'completed'
+    rated = completed and state['rating'] is not None
+    return (
+        int(state['status'] in ACTIVE_BOOKING_STATUSES),
+        int(completed),
+        state['rating'] if rated else 0.0,
+        int(rated),
+    )
+
+
+def _users(state):
+    return {state['customer_id'], state['mechanic_id']} - {None} if state else set()
+
+
+def _schedule_key(state):
+    if state is None or state['status'] not in UPCOMING_JOB_STATUSES:
+        return None
+    return state['start_time']
+
+
+def apply_job_change(before, after):
+    """Adjust the stats of everyone involved in a job going from state `before` to `after` (either may be None)."""
+    deltas = defaultdict(lambda: [0, 0, 0.0, 0])
+    for state, sign in ((before, -1), (after, 1)):
+        for user_id in _users(state):
+            for i, value in enumerate(_contribution(state)):
+                deltas[user_id][i] += sign * value
+
+    next_changed = set()
+    if _schedule_key(before) != _schedule_key(after) or _users(before) != _users(after):
+        next_changed = _users(before) | _users(after)
+
+    with transaction.atomic():
+        for user_id, (active, completed, rating_sum, rating_count) in deltas.items():
+            if not (active or completed or rating_sum or rating_count):
+                continue
+            # Users without a row yet get one computed from scratch on first read.
+            UserStats.objects.filter(user_id=user_id).update(
+                active_count=F('active_count') + active,
+                completed_count=F('completed_count') + completed,
+                rating_sum=F('rating_sum') + rating_sum,
+                rating_count=F('rating_count') + rating_count,
+                updated_at=timezone.now(),
+            )
+        for user_id in next_changed:
+            UserStats.objects.filter(user_id=user_id).update(
+                next_appointment=_next_appointment(user_id), updated_at=timezone.now()
+            )
+
+
+def _user_jobs(user_id):
+    return Job.objects.filter(Q(service_request__customer_id=user_id) | Q(mechanic_id=user_id))
+
+
+def _next_appointment(user_id):
+    return _user_jobs(user_id).filter(
+        status__in=UPCOMING_JOB_STATUSES, start_time__gte=timezone.now()
+    ).aggregate(next=Min('start_time'))['next']
+
+
+def compute_user_stats(user_id):
+    """Recompute one user's row from their jobs."""
+    totals = _user_jobs(user_id).aggregate(
+        active_count=Count('id', filter=Q(status__in=ACTIVE_BOOKING_STATUSES)),
+        completed_count=Count('id', filter=Q(status='completed')),
+        rating_sum=Sum('rating', filter=Q(status='completed')),
+        rating_count=Count('rating', filter=Q(status='completed')),
+    )
+    totals['rating_sum'] = totals['rating_sum'] or 0.0
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id, defaults={**totals, 'next_appointment': _next_appointment(user_id)}
+    )
+    return stats
+
+
+def get_user_stats(user):
+    """The user's counters: a primary-key lookup in the common case."""
+    stats = UserStats.objects.filter(user_id=user.id).first()
+    if stats is None:
+        return compute_user_stats(user.id)
+    if stats.next_appointment is not None and stats.next_appointment < timezone.now():
+        stats.next_appointment = _next_appointment(user.id)
+        UserStats.objects.filter(user_id=user.id).update(next_appointment=stats.next_appointment)
+    return stats
+
+
+_STATS_FIELDS = ('active_count', 'completed_count', 'rating_sum', 'rating_count', 'next_appointment')
+
+
+def _empty_stats():
+    return {'active_count': 0, 'completed_count': 0, 'rating_sum': 0.0, 'rating_count': 0, 'next_appointment': None}
+
+
+def _all_user_totals():
+    rows = defaultdict(_empty_stats)
+    now = timezone.now()
+    for side in ('service_request__customer_id', 'mechanic_id'):
+        for row in Job.objects.filter(**{f'{side}__isnull': False}).values(side).annotate(
+            active=Count('id', filter=Q(status__in=ACTIVE_BOOKING_STATUSES)),
+            completed=Count('id', filter=Q(status='completed')),
+            rating_total=Sum('rating', filter=Q(status='completed')),
+            rated=Count('rating', filter=Q(status='completed')),
+            upcoming=Min('start_time', filter=Q(status__in=UPCOMING_JOB_STATUSES, start_time__gte=now)),
+        ):
+            stats = rows[row[side]]
+            stats['active_count'] += row['active']
+            stats['completed_count'] += row['completed']
+            stats['rating_sum'] += row['rating_total'] or 0.0
+            stats['rating_count'] += row['rated']
+            if row['upcoming'] and (stats['next_appointment'] is None or row['upcoming'] < stats['next_appointment']):
+                stats['next_appointment'] = row['upcoming']
+    return rows
+
+
+def rebuild_all_user_stats():
+    """
+    Recompute every row with a handful of grouped queries, in place, so readers
+    never see missing stats. Returns the number of rows written.
+    """
+    with transaction.atomic():
+        # apply_job_change updates these rows inside the writer's transaction.
+        # Holding their locks while totalling makes concurrent writers wait,
+        # so their increments land on top of the rebuilt values, not under them.
+        existing = set(UserStats.objects.select_for_update().values_list('user_id', flat=True))
+        rows = _all_user_totals()
+        now = timezone.now()
+        UserStats.objects.bulk_update(
+            [UserStats(user_id=user_id, updated_at=now, **rows.get(user_id, _empty_stats())) for user_id in existing],
+            [*_STATS_FIELDS, 'updated_at'], batch_size=500,
+        )
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=user_id, **values) for user_id, values in rows.items() if user_id not in existing],
+            batch_size=500, ignore_conflicts=True,
+        )
+    return len(existing | rows.keys())
@@ -1,3 +1,651 @@
-from django.test import TestCase
+import logging
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.http import JsonResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import otp
+from .dispatch import claim_service_request, ScheduleConflict
+from .geocoding import _run_geocoding
+from .geoindex import GridIndex, mechanic_index, mechanic_position, move_mechanic, nearest_mechanics, rebuild_indexes
+from .location_writer import LocationWriter
+from .models import Job, JobTrack, MechanicLocation, ServiceRequest
+from .polyline import decode_track, encode_track, simplify, to_google_polyline
+from .ratelimit import rate_limit, rate_limiter
+from .routing import websocket_urlpatterns
+from .tracking import EtaEstimator, PingFilter, aset_mechanic_position, compact_job_track, ping_filter
+from .versions import bump_user_versions, user_version
+
+logger = logging.getLogger(__name__)
+
+# Redis isn't available to the test run, so the shared alias is a LocMem cache
+# too. Classes touching cached state are decorated with this.
+use_test_caches = override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-shared'},
+})
+
+def make_pending_request(customer, start_time=None, end_time=None):
+    service_request = ServiceRequest.objects.create(customer=customer, issue_description='Brakes squeal')
+    Job.objects.create(
+        service_request=service_request,
+        start_time=start_time or timezone.now(),
+        end_time=end_time or timezone.now(),
+        status='pending'
+    )
+    return service_request
+
+
+def make_mechanic(username, latitude=None, longitude=None):
+    mechanic = User.objects.create_user(username, password='pass12345')
+    profile = mechanic.profile
+    profile.is_mechanic = True
+    profile.is_approved = True
+    profile.base_latitude, profile.base_longitude = latitude, longitude
+    profile.save()
+    return mechanic
+
+
+@use_test_caches
+class ClaimServiceRequestTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user('customer', password='pass12345')
+        self.mechanic = User.objects.create_user('mechanic', password='pass12345')
+        self.other_mechanic = User.objects.create_user('other', password='pass12345')
+        self.service_request = make_pending_request(self.customer)
+
+    def test_claim_assigns_request_and_job(self):
+        self.assertTrue(claim_service_request(self.service_request.id, self.mechanic))
+        self.service_request.refresh_from_db()
+        job = self.service_request.jobs.get()
+        self.assertEqual(self.service_request.mechanic, self.mechanic)
+        self.assertEqual(self.service_request.status, 'accepted')
+        self.assertEqual(job.mechanic, self.mechanic)
+        self.assertEqual(job.status, 'scheduled')
+
+    def test_second_claim_loses(self):
+        self.assertTrue(claim_service_request(self.service_request.id, self.mechanic))
+        self.assertFalse(claim_service_request(self.service_request.id, self.other_mechanic))
+        self.service_request.refresh_from_db()
+        self.assertEqual(self.service_request.mechanic, self.mechanic)
+
+
+@use_test_caches
+class ClaimServiceRequestStressTest(TransactionTestCase):
+    mechanic_count = 8
+    request_count = 20
+
+    def test_exactly_one_winner_per_request(self):
+        customer = User.objects.create_user('customer', password='pass12345')
+        mechanics = [User.objects.create_user(f'mechanic{i}', password='pass12345') for i in range(self.mechanic_count)]
+        request_ids = [make_pending_request(customer).id for _ in range(self.request_count)]
+        wins = {request_id: [] for request_id in request_ids}
+        attempts = []
+        errors = []
+        lock = threading.Lock()
+
+        def race(mechanic, barrier):
+            try:
+                for request_id in request_ids:
+                    barrier.wait()
+                    won = claim_service_request(request_id, mechanic)
+                    with lock:
+                        attempts.append(request_id)
+                        if won:
+                            wins[request_id].append(mechanic.id)
+            except threading.BrokenBarrierError:
+                pass  # Another thread failed and released everyone.
+            except Exception as e:
+                errors.append(e)
+                barrier.abort()
+            finally:
+                connection.close()
+
+        barrier = threading.Barrier(self.mechanic_count)
+        threads = [threading.Thread(target=race, args=(mechanic, barrier)) for mechanic in mechanics]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(attempts), self.mechanic_count * self.request_count)
+        for request_id, winners in wins.items():
+            self.assertEqual(len(winners), 1, f"request {request_id} had winners {winners}")
+            service_request = ServiceRequest.objects.get(id=request_id)
+            self.assertEqual(service_request.mechanic_id, winners[0])
+            self.assertEqual(service_request.jobs.get().mechanic_id, winners[0])
+        logger.info(f"{len(attempts)} concurrent claims in {elapsed:.3f}s ({len(attempts) / elapsed:.0f} claims/s)")
+
+
+@use_test_caches
+class ClaimScheduleConflictTest(TransactionTestCase):
+    def test_concurrent_overlapping_claims_book_one(self):
+        customer = User.objects.create_user('customer', password='pass12345')
+        mechanic = User.objects.create_user('mechanic', password='pass12345')
+        start = timezone.now() + timedelta(days=1)
+        request_ids = [
+            make_pending_request(customer, start, start + timedelta(hours=2)).id,
+            make_pending_request(customer, start + timedelta(hours=1), start + timedelta(hours=3)).id,
+        ]
+        results = []
+        lock = threading.Lock()
+
+        def claim(request_id, barrier):
+            try:
+                barrier.wait()
+                try:
+                    result = claim_service_request(request_id, mechanic)
+                except ScheduleConflict:
+                    result = 'conflict'
+                except Exception as e:
+                    result = repr(e)  # e.g. "database is locked": fails the test below
+                with lock:
+                    results.append(result)
+            finally:
+                connection.close()
+
+        barrier = threading.Barrier(len(request_ids))
+        threads = [threading.Thread(target=claim, args=(request_id, barrier)) for request_id in request_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results, key=str), [True, 'conflict'])
+        self.assertEqual(Job.objects.filter(mechanic=mechanic, status='scheduled').count(), 1)
+        self.assertEqual(ServiceRequest.objects.filter(mechanic=mechanic).count(), 1)
+
+
+class GridIndexTests(TestCase):
+    def test_nearest_and_within_are_ordered_by_distance(self):
+        index = GridIndex()
+        index.upsert('near', 13.01, 80.0)
+        index.upsert('mid', 13.1, 80.0)
+        index.upsert('far', 14.0, 80.0)
+        self.assertEqual([key for _, key, _ in index.nearest(13.0, 80.0, 2, radius_km=50)], ['near', 'mid'])
+        self.assertEqual([key for _, key, _ in index.within(13.0, 80.0, 50)], ['near', 'mid'])
+
+    def test_upsert_moves_a_point(self):
+        index = GridIndex()
+        index.upsert('a', 13.0, 80.0)
+        index.upsert('a', 14.0, 80.0)
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.within(13.0, 80.0, 10), [])
+
+
+@use_test_caches
+class MechanicLivePositionTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        self.mechanic = User.objects.create_user('mechanic', password='pass12345')
+        profile = self.mechanic.profile
+        profile.is_mechanic = True
+        profile.is_approved = True
+        profile.base_latitude, profile.base_longitude = 13.0, 80.0
+        profile.save()
+        self.roaming = User.objects.create_user('roaming', password='pass12345')
+        profile = self.roaming.profile
+        profile.is_mechanic = True
+        profile.is_approved = True
+        profile.save()
+
+    def share(self, user, lat, lng, at=None):
+        async_to_sync(aset_mechanic_position)(user.id, lat, lng, at or time.time())
+
+    def test_rebuild_uses_live_positions(self):
+        self.share(self.mechanic, 13.5, 80.0)
+        self.share(self.roaming, 13.51, 80.0)
+        rebuild_indexes()
+        self.assertEqual(mechanic_index.get(self.mechanic.id)[:2], (13.5, 80.0))
+        # Mechanics without a home base are matched while they share a position.
+        nearest = [mechanic_id for _, mechanic_id in nearest_mechanics(13.5, 80.0, k=2, radius_km=10)]
+        self.assertEqual(nearest, [self.mechanic.id, self.roaming.id])
+
+    def test_rebuild_keeps_a_fresher_local_move(self):
+        self.share(self.mechanic, 13.5, 80.0, at=time.time() - 10)
+        rebuild_indexes()
+        move_mechanic(self.mechanic.id, 13.6, 80.0, time.time())
+        rebuild_indexes()
+        self.assertEqual(mechanic_index.get(self.mechanic.id)[:2], (13.6, 80.0))
+
+    def test_profile_save_does_not_reset_live_position(self):
+        self.share(self.mechanic, 13.5, 80.0)
+        rebuild_indexes()
+        self.mechanic.profile.save()
+        self.assertEqual(mechanic_index.get(self.mechanic.id)[:2], (13.5, 80.0))
+
+    def test_mechanic_position_prefers_live_then_base(self):
+        self.assertEqual(mechanic_position(self.mechanic), (13.0, 80.0))
+        self.share(self.mechanic, 13.5, 80.0)
+        self.assertEqual(mechanic_position(self.mechanic), (13.5, 80.0))
+        self.assertIsNone(mechanic_position(self.roaming))
+
+
+@use_test_caches
+class UserVersionTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+
+    def test_bumps_are_strictly_increasing(self):
+        versions = [user_version(1)]
+        for _ in range(5):
+            bump_user_versions(1)
+            versions.append(user_version(1))
+        self.assertEqual(versions, sorted(set(versions)))
+
+    def test_versions_live_in_the_shared_cache(self):
+        bump_user_versions(1)
+        self.assertEqual(caches['shared'].get('versions:user:1'), user_version(1))
+        self.assertIsNone(caches['default'].get('versions:user:1'))
+
+
+@use_test_caches
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class OtpTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        customer = User.objects.create_user('customer', password='pass12345')
+        self.service_request = make_pending_request(customer)
+
+    def issue(self, action='start'):
+        return otp.issue_otp(self.service_request, action)
+
+    def verify(self, code, action='start'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return otp.verify_and_consume(self.service_request, code, action)
+
+    def wrong(self, code):
+        return f'{(int(code) + 1) % 10 ** 6:06d}'
+
+    def test_correct_code_is_single_use(self):
+        code = self.issue()
+        self.assertEqual(self.verify(code), otp.VERIFIED)
+        self.assertEqual(self.verify(code), otp.NO_OTP)
+        self.assertIsNone(otp.active_otp(self.service_request.id))
+
+    def test_wrong_code_and_action(self):
+        code = self.issue()
+        self.assertEqual(self.verify(self.wrong(code)), otp.WRONG_CODE)
+        self.assertEqual(self.verify(code, 'complete'), otp.WRONG_ACTION)
+        self.assertEqual(self.verify(code), otp.VERIFIED)
+
+    def test_attempts_lock_the_code_until_reissued(self):
+        code = self.issue()
+        for _ in range(otp.OTP_MAX_ATTEMPTS):
+            self.assertEqual(self.verify(self.wrong(code)), otp.WRONG_CODE)
+        self.assertEqual(self.verify(code), otp.TOO_MANY_ATTEMPTS)
+        self.assertEqual(self.verify(self.issue()), otp.VERIFIED)
+
+    def test_expired_code_is_rejected(self):
+        code = self.issue()
+        later = timezone.now() + otp.OTP_TTL + timedelta(seconds=1)
+        with mock.patch('main.otp.timezone.now', return_value=later):
+            self.assertEqual(self.verify(code), otp.NO_OTP)
+
+    def test_missing_code_is_cached(self):
+        request_id = self.service_request.id
+        self.assertEqual(otp.active_otps([request_id]), {})
+        with self.assertNumQueries(0):
+            self.assertEqual(otp.active_otps([request_id]), {})
+        code = self.issue()
+        with self.assertNumQueries(0):
+            self.assertEqual(otp.active_otp(request_id)['otp'], code)
+
+    def test_lost_cache_falls_back_to_the_database(self):
+        code = self.issue()
+        caches['shared'].clear()
+        self.assertEqual(otp.active_otp(self.service_request.id)['otp'], code)
+        self.assertEqual(self.verify(code), otp.VERIFIED)
+
+
+@use_test_caches
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class MechanicLocationAuthTest(TransactionTestCase):
+    def setUp(self):
+        self.mechanic = make_mechanic('mechanic')
+        self.other = make_mechanic('other')
+
+    def test_only_the_mechanic_can_connect(self):
+        async_to_sync(self.check_connect)()
+
+    async def connects(self, user):
+        path = f'/ws/mechanic/location/{self.mechanic.id}/'
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        await communicator.disconnect()
+        return connected
+
+    async def check_connect(self):
+        self.assertFalse(await self.connects(AnonymousUser()))
+        self.assertFalse(await self.connects(self.other))
+        self.assertTrue(await self.connects(self.mechanic))
+
+
+@rate_limit('test')
+def limited_view(request):
+    return JsonResponse({'success': True})
+
+
+@use_test_caches
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMITS={'test': [{'key': 'ip', 'rate': '3/s'}]})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.factory = RequestFactory()
+
+    def post(self, ip='10.0.0.1'):
+        return limited_view(self.factory.post('/', REMOTE_ADDR=ip))
+
+    def test_burst_then_429_then_recovery(self):
+        self.assertEqual([self.post().status_code for _ in range(3)], [200] * 3)
+        refused = self.post()
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused['Retry-After'], '1')
+        # Other clients have their own bucket.
+        self.assertEqual(self.post(ip='10.0.0.2').status_code, 200)
+        # One emission interval (1/3 s) frees a single token.
+        time.sleep(0.4)
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(self.post().status_code, 429)
+        self.assertGreaterEqual(rate_limiter.stats()['test']['limited'], 2)
+
+
+class PolylineTests(TestCase):
+    def test_encode_decode_round_trip(self):
+        points = [(13.0827, 80.2707, 1700000000), (13.08271, 80.27069, 1700000005), (-33.86882, 151.20929, 1700000600)]
+        decoded = decode_track(encode_track(points))
+        self.assertEqual(len(decoded), len(points))
+        for (lat, lng, ts), (decoded_lat, decoded_lng, decoded_ts) in zip(points, decoded):
+            self.assertAlmostEqual(lat, decoded_lat, delta=0.5e-5)
+            self.assertAlmostEqual(lng, decoded_lng, delta=0.5e-5)
+            self.assertEqual(ts, decoded_ts)
+
+    def test_google_polyline(self):
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        self.assertEqual(to_google_polyline(points), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+
+    def test_simplify_keeps_endpoints_and_corners(self):
+        # About 1 m of jitter along a straight road, then a right-angle turn.
+        straight = [(13.0 + i * 0.0001, 80.0 + (0.00001 if i % 2 else 0), i) for i in range(11)]
+        turn = [(13.001, 80.0 + i * 0.0001, 10 + i) for i in range(1, 11)]
+        simplified = simplify(straight + turn, tolerance_m=10)
+        self.assertEqual(simplified, [straight[0], straight[-1], turn[-1]])
+        self.assertEqual(simplify(straight, tolerance_m=10), [straight[0], straight[-1]])
+
+
+@use_test_caches
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class TrackCompactionTests(TestCase):
+    def setUp(self):
+        customer = User.objects.create_user('customer', password='pass12345')
+        self.mechanic = make_mechanic('mechanic')
+        self.job = make_pending_request(customer).jobs.get()
+        self.job.mechanic = self.mechanic
+        self.job.status = 'completed'
+        self.job.save()
+
+    def record(self, points):
+        start = timezone.now() - timedelta(hours=1)
+        MechanicLocation.objects.bulk_create(
+            MechanicLocation(mechanic=self.mechanic, job=self.job, latitude=lat, longitude=lng,
+                             timestamp=start + timedelta(seconds=seconds))
+            for lat, lng, seconds in points
+        )
+
+    def test_compaction_counts_raw_and_kept_points(self):
+        self.record([(13.0 + i * 0.0001, 80.0, i) for i in range(20)])
+        track = compact_job_track(self.job)
+        self.assertEqual(track.raw_point_count, 20)
+        self.assertEqual(track.point_count, 2)
+        self.assertFalse(self.job.mechanic_locations.exists())
+
+        # Late rows are merged into the existing track.
+        self.record([(13.0019, 80.001, 30)])
+        track = compact_job_track(self.job)
+        self.assertEqual(track.raw_point_count, 21)
+        self.assertEqual(track.point_count, 3)
+
+    def test_prune_compacts_jobs_left_with_raw_rows(self):
+        # Completing the job in a test doesn't run the on_commit compaction,
+        # just like a compaction that failed.
+        self.record([(13.0 + i * 0.0001, 80.0, i) for i in range(5)])
+        call_command('prune_locations', stdout=StringIO())
+        track = JobTrack.objects.get(job=self.job)
+        self.assertEqual(track.raw_point_count, 5)
+        self.assertFalse(MechanicLocation.objects.filter(job=self.job).exists())
+
+
+@use_test_caches
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+@mock.patch('main.views.REQUEST_BOARD_PAGE_SIZE', 2)
+class RequestBoardPaginationTests(TestCase):
+    def setUp(self):
+        customer = User.objects.create_user('customer', password='pass12345')
+        self.client.force_login(make_mechanic('mechanic'))
+        created = [ServiceRequest.objects.create(customer=customer, issue_description='Flat tyre') for _ in range(5)]
+        # Same timestamp for all, so pages are split purely on id.
+        ServiceRequest.objects.update(created_at=timezone.now())
+        self.ids = sorted((service_request.id for service_request in created), reverse=True)
+
+    def page(self, cursor=None):
+        params = {'cursor': cursor} if cursor else {}
+        return self.client.get('/api/service-requests/', params)
+
+    def test_pages_break_ties_on_id_and_end_with_no_cursor(self):
+        seen, cursor, pages = [], None, 0
+        while True:
+            data = self.page(cursor).json()
+            seen += [row['id'] for row in data['requests']]
+            pages += 1
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.ids)
+        self.assertEqual(pages, 3)
+
+    def test_bad_cursor_is_rejected(self):
+        for cursor in ['garbage', '1.2.3', '12345', f'{10 ** 30}.1', 'abc.1']:
+            response = self.page(cursor)
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertFalse(response.json()['success'])
+
+
+class PingFilterTests(TestCase):
+    def setUp(self):
+        self.filter = PingFilter(min_distance_m=15, min_interval_s=5, state_ttl_s=60)
+
+    def test_dead_band_and_interval(self):
+        self.assertTrue(self.filter.accept(1, 13.0, 80.0, 'en_route', at=100))
+        # About 11 m away: inside the dead-band however long we wait.
+        self.assertFalse(self.filter.accept(1, 13.0001, 80.0, 'en_route', at=200))
+        # Far enough, but too soon after the last accepted ping.
+        self.assertFalse(self.filter.accept(1, 13.001, 80.0, 'en_route', at=103))
+        self.assertTrue(self.filter.accept(1, 13.001, 80.0, 'en_route', at=105))
+        # A status change always gets through.
+        self.assertTrue(self.filter.accept(1, 13.001, 80.0, 'in_progress', at=106))
+        # Jobs don't share state.
+        self.assertTrue(self.filter.accept(2, 13.001, 80.0, 'en_route', at=106))
+        self.assertEqual(self.filter.stats()[1], {'accepted': 3, 'dropped': 2})
+
+    def test_forget_and_idle_jobs_are_evicted(self):
+        self.filter.accept(1, 13.0, 80.0, at=100)
+        self.filter.forget(1)
+        self.assertEqual(self.filter.stats(), {})
+
+        ping_filter = PingFilter(state_ttl_s=0.05)
+        ping_filter.accept(1, 13.0, 80.0, at=100)
+        time.sleep(0.1)
+        ping_filter.accept(2, 13.0, 80.0, at=100)
+        self.assertEqual(list(ping_filter.stats()), [2])
+        self.assertEqual(ping_filter.last_accepted_at(1), 0)
+
+    def test_idle_eta_state_is_evicted(self):
+        estimator = EtaEstimator(state_ttl_s=0.05)
+        estimator.update(1, 13.0, 80.0, (13.1, 80.0), at=100)
+        time.sleep(0.1)
+        estimator.update(2, 13.0, 80.0, (13.1, 80.0), at=100)
+        self.assertEqual(set(estimator._history), {2})
+        self.assertEqual(set(estimator._published), {2})
+
+
+@use_test_caches
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class LocationBatchClockTest(TransactionTestCase):
+    def setUp(self):
+        customer = User.objects.create_user('customer', password='pass12345')
+        self.mechanic = make_mechanic('mechanic')
+        self.job = make_pending_request(customer).jobs.get()
+        Job.objects.filter(id=self.job.id).update(mechanic=self.mechanic, status='en_route')
+
+    def test_future_client_timestamps_are_clamped_to_receive_time(self):
+        async_to_sync(self.send_batch)()
+        stored = MechanicLocation.objects.get(job=self.job)
+        self.assertLessEqual(stored.timestamp, timezone.now())
+        self.assertLessEqual(ping_filter.last_accepted_at(self.job.id), time.time())
+
+    async def send_batch(self):
+        path = f'/ws/mechanic/location/{self.mechanic.id}/'
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        communicator.scope['user'] = self.mechanic
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        ahead = (timezone.now() + timedelta(seconds=50)).isoformat()
+        await communicator.send_json_to({
+            'job_id': self.job.id, 'points': [{'latitude': 13.0, 'longitude': 80.0, 'timestamp': ahead}],
+        })
+        self.assertEqual(await communicator.receive_json_from(timeout=2), {'batch': {'received': 1, 'stored': 1}})
+        await communicator.disconnect()
+
+
+@use_test_caches
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class CalendarEventsTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user('customer', password='pass12345')
+        self.mechanic = make_mechanic('mechanic')
+        self.client.force_login(self.mechanic)
+        self.window = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=10)
+
+    def job(self, start, end):
+        job = make_pending_request(self.customer, start, end).jobs.get()
+        job.mechanic, job.status = self.mechanic, 'scheduled'
+        job.save()
+        return job
+
+    def test_window_includes_long_jobs_that_began_before_it(self):
+        long_job = self.job(self.window - Job.MAX_DURATION + timedelta(hours=1), self.window + timedelta(hours=1))
+        inside = self.job(self.window + timedelta(days=1), self.window + timedelta(days=1, hours=2))
+        self.job(self.window - timedelta(days=2), self.window - timedelta(days=1))
+        response = self.client.get('/api/calendar/events/', {
+            'start': self.window.date().isoformat(), 'end': (self.window + timedelta(days=7)).date().isoformat(),
+        })
+        self.assertEqual([event['id'] for event in response.json()['events']], [long_job.id, inside.id])
+
+    def test_jobs_longer_than_the_maximum_are_rejected(self):
+        with self.assertRaises(ValidationError):
+            self.job(self.window, self.window + Job.MAX_DURATION + timedelta(minutes=1))
+
+
+@use_test_caches
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class LocationWriterTests(TestCase):
+    def setUp(self):
+        customer = User.objects.create_user('customer', password='pass12345')
+        self.mechanic = make_mechanic('mechanic')
+        self.job = make_pending_request(customer).jobs.get()
+        self.writer = LocationWriter(batch_size=100, flush_interval=60, max_buffer=3)
+
+    def location(self, latitude=13.0, job_id=None):
+        return MechanicLocation(mechanic=self.mechanic, job_id=job_id or self.job.id, latitude=latitude, longitude=80.0)
+
+    def test_failed_batch_is_retried(self):
+        async def write():
+            self.writer.add(self.location())
+            with mock.patch.object(MechanicLocation.objects, 'abulk_create', side_effect=OperationalError('locked')):
+                self.assertEqual(await self.writer.flush(), 0)
+            self.assertEqual(len(self.writer), 1)
+            self.writer.add(self.location(13.1))
+            self.assertEqual(await self.writer.drain(), 2)
+        async_to_sync(write)()
+        self.assertEqual(list(MechanicLocation.objects.order_by('id').values_list('latitude', flat=True)), [13.0, 13.1])
+
+    def test_retry_buffer_is_capped_and_skips_deleted_jobs(self):
+        async def write():
+            for latitude in (13.0, 13.1):
+                self.writer.add(self.location(latitude))
+            self.writer.add(self.location(job_id=self.job.id + 1000))
+            with mock.patch.object(MechanicLocation.objects, 'abulk_create', side_effect=IntegrityError('job')):
+                await self.writer.flush()
+            self.assertEqual(len(self.writer), 2)
+            for latitude in (13.2, 13.3):
+                self.writer.add(self.location(latitude))
+            with mock.patch.object(MechanicLocation.objects, 'abulk_create', side_effect=OperationalError('locked')):
+                await self.writer.flush()
+            self.assertEqual([location.latitude for location in self.writer._buffer], [13.1, 13.2, 13.3])
+            self.assertEqual(self.writer.dropped, 1)
+        async_to_sync(write)()
+
+
+class FixedGeocoder:
+    """Geocoding provider for tests."""
+    places = {'anna nagar, chennai': (13.05, 80.0)}
+
+    def geocode(self, query):
+        return self.places.get(query)
+
+
+@use_test_caches
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    GEOCODING_PROVIDER='main.tests.FixedGeocoder',
+    MECHANIC_MATCH_RADIUS_KM=25,
+)
+class RequestFeedRadiusTest(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        self.customer = User.objects.create_user('customer', password='pass12345')
+        self.near = make_mechanic('near', 13.0, 80.0)
+        self.far = make_mechanic('far', 20.0, 80.0)
+
+    def test_new_request_only_reaches_mechanics_in_range(self):
+        async_to_sync(self.check_feed)()
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/mechanic/feed/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def check_feed(self):
+        near, far = await self.connect(self.near), await self.connect(self.far)
+        service_request = await ServiceRequest.objects.acreate(customer=self.customer, location='Anna Nagar, Chennai')
+        # What book_service schedules after commit.
+        await sync_to_async(_run_geocoding)(service_request.id, publish=True)
+
+        event = await near.receive_json_from(timeout=2)
+        self.assertEqual(event['event'], 'request_created')
+        self.assertEqual(event['request']['id'], service_request.id)
+        self.assertAlmostEqual(event['request']['distance_km'], 5.6, places=1)
+        self.assertTrue(await far.receive_nothing(timeout=0.5))
+        await near.disconnect()
+        await far.disconnect()
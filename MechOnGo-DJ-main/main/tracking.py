@@ -0,0 +1,369 @@
+"""
+Shared state for live mechanic tracking.
+
+The newest accepted position of every tracked job is kept in the shared cache so
+a freshly opened tracking page can be hydrated without reading MechanicLocation,
+and so is every mechanic's newest position, for distance matching in
+``main.geoindex``.
+Incoming pings are first passed through ``ping_filter`` which drops fixes that
+add nothing to the customer's map, and accepted pings feed ``eta_estimator``
+whose throttled ETA rides along with every broadcast. Once a job is completed its raw pings are
+folded into a single JobTrack by ``compact_job_track``, on a background thread;
+``prune_locations`` re-runs it for completed jobs that still have raw rows,
+such as those flushed by the write-behind buffer after completion.
+"""
+import datetime
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Job, JobTrack
+from .polyline import simplify, encode_track
+from .sharedcache import shared_cache as cache
+
+logger = logging.getLogger(__name__)
+
+# Job statuses for which a mechanic may report locations.
+TRACKABLE_JOB_STATUSES = ['en_route', 'in_progress']
+
+# Positions older than this are not worth showing on a map anyway.
+LAST_POSITION_TIMEOUT = 60 * 60 * 6
+
+
+def mechanic_group_name(mechanic_id):
+    return f'mechanic_location_{mechanic_id}'
+
+
+def job_group_name(job_id):
+    return f'job_location_{job_id}'
+
+
+def notify_jobs_changed(mechanic_id):
+    """
+    Tell the mechanic's open location sockets to reload their authorized jobs.
+    Called from synchronous views after a job status change is saved.
+    """
+    if not mechanic_id:
+        return
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            mechanic_group_name(mechanic_id), {'type': 'jobs_changed'}
+        )
+    except Exception:
+        logger.warning(f"Could not notify location sockets of mechanic {mechanic_id}", exc_info=True)
+
+
+def _last_position_key(job_id):
+    return f'tracking:last_position:{job_id}'
+
+
+async def aset_last_position(job_id, position):
+    await cache.aset(_last_position_key(job_id), position, LAST_POSITION_TIMEOUT)
+
+
+async def aget_last_position(job_id):
+    return await cache.aget(_last_position_key(job_id))
+
+
+def get_last_positions(job_ids):
+    """Return {job_id: position} for the jobs that have a cached position."""
+    keys = {_last_position_key(job_id): job_id for job_id in job_ids}
+    found = cache.get_many(keys.keys())
+    return {keys[key]: position for key, position in found.items()}
+
+
+def live_position_timeout():
+    # How long a mechanic's last ping stands in for their position before
+    # matching falls back to their home base.
+    return getattr(settings, 'LIVE_POSITION_TIMEOUT_SECONDS', 15 * 60)
+
+
+def _mechanic_position_key(mechanic_id):
+    return f'tracking:mechanic_position:{mechanic_id}'
+
+
+async def aset_mechanic_position(mechanic_id, latitude, longitude, at):
+    await cache.aset(_mechanic_position_key(mechanic_id), (latitude, longitude, at), live_position_timeout())
+
+
+def get_mechanic_positions(mechanic_ids):
+    """Return {mechanic_id: (lat, lng, unix_time)} for mechanics who pinged recently."""
+    keys = {_mechanic_position_key(mechanic_id): mechanic_id for mechanic_id in mechanic_ids}
+    found = cache.get_many(keys.keys())
+    return {keys[key]: position for key, position in found.items()}
+
+
+def parse_client_timestamp(value):
+    """
+    Parse a timestamp sent by the mechanic app: an ISO 8601 string or a Unix
+    time in seconds or milliseconds. Naive values are taken as UTC. Raises
+    ValueError for anything unparseable or in the future.
+    """
+    if isinstance(value, bool):
+        raise ValueError("Invalid timestamp")
+    if isinstance(value, (int, float)):
+        seconds = value / 1000 if value > 1e11 else value
+        try:
+            parsed = datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc)
+        except (OverflowError, OSError):
+            # Infinity, or a time outside what the platform can represent.
+            raise ValueError("Invalid timestamp")
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError("Invalid timestamp")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    if parsed > timezone.now() + datetime.timedelta(minutes=1):
+        raise ValueError("Timestamp is in the future")
+    return parsed
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in metres."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+
+class IdleJobs:
+    """
+    Job ids in order of last use, so per-job state that stopped receiving
+    pings (e.g. a job completed while its mechanic was offline) can be found
+    and dropped in O(1) per call.
+    """
+
+    def __init__(self, ttl_s=None):
+        self.ttl_s = ttl_s if ttl_s is not None else getattr(settings, 'LOCATION_STATE_TTL_S', 60 * 60)
+        self._used = OrderedDict()
+
+    def touch(self, job_id):
+        """Mark `job_id` as used now; returns the ids idle for longer than the TTL."""
+        now = time.monotonic()
+        self._used[job_id] = now
+        self._used.move_to_end(job_id)
+        expired = []
+        for oldest, used_at in self._used.items():
+            if now - used_at < self.ttl_s:
+                break
+            expired.append(oldest)
+        for oldest in expired:
+            del self._used[oldest]
+        return expired
+
+    def discard(self, job_id):
+        self._used.pop(job_id, None)
+
+    def __len__(self):
+        return len(self._used)
+
+
+class PingFilter:
+    """
+    Per-job dead-band and rate limit for location pings.
+
+    A ping is accepted when it is the first one for the job, when the job's
+    status differs from the last accepted ping, or when it is both at least
+    ``min_distance_m`` away from and ``min_interval_s`` later than the last
+    accepted ping. Times are compared across live and batched pings, so
+    callers pass server receive times, with client timestamps clamped to them.
+    State and counters live in process memory; a job's are
+    dropped by ``forget`` or once it has gone ``state_ttl_s`` without a ping.
+    """
+
+    def __init__(self, min_distance_m=None, min_interval_s=None, state_ttl_s=None):
+        self.min_distance_m = min_distance_m if min_distance_m is not None else getattr(settings, 'LOCATION_MIN_DISTANCE_M', 15)
+        self.min_interval_s = min_interval_s if min_interval_s is not None else getattr(settings, 'LOCATION_MIN_INTERVAL_S', 5)
+        self._last = {}
+        self._counters = {}
+        self._idle = IdleJobs(state_ttl_s)
+
+    def accept(self, job_id, latitude, longitude, status=None, at=None):
+        at = time.time() if at is None else at
+        for expired in self._idle.touch(job_id):
+            self.forget(expired)
+        counters = self._counters.setdefault(job_id, {'accepted': 0, 'dropped': 0})
+        last = self._last.get(job_id)
+
+        if last is not None and status == last[3]:
+            last_lat, last_lng, last_at = last[:3]
+            if (at - last_at < self.min_interval_s
+                    or haversine_m(last_lat, last_lng, latitude, longitude) < self.min_distance_m):
+                counters['dropped'] += 1
+                return False
+
+        self._last[job_id] = (latitude, longitude, at, status)
+        counters['accepted'] += 1
+        return True
+
+    def accept_many(self, job_id, points, status=None):
+        """
+        Filter a time-ordered batch of (latitude, longitude, at) points.
+        Returns a list of booleans, one per point.
+        """
+        newest = self._last.get(job_id)
+        if newest is not None and points and points[0][2] < newest[2]:
+            # Replayed history from before the newest live ping: dead-band it on its own.
+            del self._last[job_id]
+        keep = [self.accept(job_id, lat, lng, status, at) for lat, lng, at in points]
+        if newest is not None and self._last[job_id][2] < newest[2]:
+            self._last[job_id] = newest
+        return keep
+
+    def last_accepted_at(self, job_id):
+        last = self._last.get(job_id)
+        return last[2] if last is not None else 0
+
+    def forget(self, job_id):
+        self._last.pop(job_id, None)
+        self._counters.pop(job_id, None)
+        self._idle.discard(job_id)
+
+    def stats(self):
+        return {job_id: dict(counters) for job_id, counters in self._counters.items()}
+
+
+ping_filter = PingFilter()
+
+
+class EtaEstimator:
+    """
+    Per-job ETA to the service request's destination.
+
+    Speed is measured over the last ``window`` accepted points and smoothed
+    with an exponential moving average; until it is known (or while the van is
+    crawling) ``default_speed_kmh`` is used instead. The published ETA only
+    moves when it changed by at least ``min_change_s`` seconds (or 5%) and
+    ``min_interval_s`` seconds have passed since the last change, so clients
+    see a steady number rather than per-ping jitter. Like ``PingFilter``, a
+    job's state is dropped by ``forget`` or after ``state_ttl_s`` without a point.
+    """
+
+    SMOOTHING = 0.3
+    MIN_SPEED_MPS = 1.0
+
+    def __init__(self, window=5, default_speed_kmh=None, min_change_s=None, min_interval_s=None, state_ttl_s=None):
+        self.window = window
+        self.default_speed_mps = (default_speed_kmh or getattr(settings, 'ETA_DEFAULT_SPEED_KMH', 25)) / 3.6
+        self.min_change_s = min_change_s if min_change_s is not None else getattr(settings, 'ETA_MIN_CHANGE_S', 30)
+        self.min_interval_s = min_interval_s if min_interval_s is not None else getattr(settings, 'ETA_MIN_INTERVAL_S', 15)
+        self._history = {}
+        self._speed = {}
+        self._published = {}
+        self._idle = IdleJobs(state_ttl_s)
+
+    def _measured_speed(self, history):
+        elapsed = history[-1][2] - history[0][2]
+        if elapsed <= 0:
+            return None
+        travelled = sum(
+            haversine_m(a[0], a[1], b[0], b[1])
+            for a, b in zip(history, list(history)[1:])
+        )
+        return travelled / elapsed
+
+    def update(self, job_id, latitude, longitude, destination, at=None):
+        """Record an accepted point and return the published ETA in seconds (or None)."""
+        at = time.time() if at is None else at
+        for expired in self._idle.touch(job_id):
+            self.forget(expired)
+        history = self._history.setdefault(job_id, deque(maxlen=self.window))
+        history.append((latitude, longitude, at))
+
+        if len(history) >= 2:
+            measured = self._measured_speed(history)
+            if measured is not None:
+                previous = self._speed.get(job_id)
+                self._speed[job_id] = measured if previous is None else (
+                    self.SMOOTHING * measured + (1 - self.SMOOTHING) * previous
+                )
+
+        if not destination or destination[0] is None or destination[1] is None:
+            return None
+
+        speed = self._speed.get(job_id)
+        if speed is None or speed < self.MIN_SPEED_MPS:
+            speed = self.default_speed_mps
+        eta = round(haversine_m(latitude, longitude, destination[0], destination[1]) / speed)
+
+        published = self._published.get(job_id)
+        if published is not None:
+            published_eta, published_at = published
+            change = abs(eta - published_eta)
+            if change < max(self.min_change_s, 0.05 * published_eta) or at - published_at < self.min_interval_s:
+                return published_eta
+        self._published[job_id] = (eta, at)
+        return eta
+
+    def forget(self, job_id):
+        self._history.pop(job_id, None)
+        self._speed.pop(job_id, None)
+        self._published.pop(job_id, None)
+        self._idle.discard(job_id)
+
+
+eta_estimator = EtaEstimator()
+
+
+def compact_job_track(job, tolerance_m=None):
+    """
+    Replace the job's raw MechanicLocation rows with a simplified JobTrack.
+
+    Safe to call again later: points already in the track are merged with any
+    raw rows written since, e.g. by a late write-behind flush.
+    """
+    tolerance_m = tolerance_m if tolerance_m is not None else getattr(settings, 'TRACK_SIMPLIFY_TOLERANCE_M', 10)
+    rows = list(job.mechanic_locations.order_by('timestamp', 'id').values_list('id', 'latitude', 'longitude', 'timestamp'))
+    raw_points = [(lat, lng, ts.timestamp()) for _, lat, lng, ts in rows]
+    existing = JobTrack.objects.filter(job=job).first()
+    if not raw_points:
+        return existing
+
+    points = raw_points
+    raw_point_count = len(raw_points)
+    if existing:
+        points = sorted(existing.points + raw_points, key=lambda point: point[2])
+        raw_point_count += existing.raw_point_count
+
+    simplified = simplify(points, tolerance_m)
+    with transaction.atomic():
+        track, _ = JobTrack.objects.update_or_create(job=job, defaults={
+            'encoded_points': encode_track(simplified),
+            'point_count': len(simplified),
+            'raw_point_count': raw_point_count,
+            'started_at': datetime.datetime.fromtimestamp(points[0][2], tz=datetime.timezone.utc),
+            'ended_at': datetime.datetime.fromtimestamp(points[-1][2], tz=datetime.timezone.utc),
+        })
+        # Only the rows folded in; anything written meanwhile waits for the next run.
+        job.mechanic_locations.filter(id__in=[row[0] for row in rows]).delete()
+    return track
+
+
+_compaction_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='track-compaction')
+
+
+def _run_compaction(job_id):
+    close_old_connections()
+    try:
+        job = Job.objects.filter(id=job_id).first()
+        if job is not None:
+            compact_job_track(job)
+    except Exception:
+        logger.exception(f"Failed to compact track for job {job_id}")
+    finally:
+        close_old_connections()
+
+
+def schedule_track_compaction(job):
+    """Compact the job's track in the background once the current transaction commits."""
+    job_id = job.id
+    transaction.on_commit(lambda: _compaction_executor.submit(_run_compaction, job_id))
@@ -28,4 +28,12 @@ urlpatterns = [
     path('customer/payment-billing/', views.payment_billing, name='payment_billing'),
     path('customer/profile/', views.customer_profile, name='customer_profile'),
     path('api/stop-location-sharing/', views.stop_location_sharing, name='stop_location_sharing'),
+    path('api/jobs/<int:job_id>/track/', views.job_track, name='job_track'),
+    path('api/customer/bookings/', views.customer_bookings, name='customer_bookings'),
+    path('api/service-requests/', views.service_requests_page, name='service_requests_page'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
+    path('mechanic/service-calendar/reset-link/', views.reset_calendar_feed, name='reset_calendar_feed'),
+    path('api/calendar/events/', views.calendar_events, name='calendar_events'),
+    path('api/availability/', views.availability, name='availability'),
+    path('api/metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
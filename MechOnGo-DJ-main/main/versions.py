@@ -0,0 +1,55 @@
+"""
+Per-user change versions.
+
+Each user has a version number in the shared cache: the time in milliseconds
+of the last write to one of their bookings, jobs or invoices. Signals in
+``main.signals`` bump it on every save, so a client that remembers the
+version it last saw can ask "anything new?" with a single cache read, on
+whichever worker it reaches.
+"""
+import time
+
+from .sharedcache import shared_cache as cache
+
+# Versions only need to outlive the clients polling them; a missing one is
+# simply re-seeded, which makes clients refetch once.
+VERSION_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(user_id):
+    return f'versions:user:{user_id}'
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def user_version(user_id):
+    """The user's current version, seeding it if the cache has none."""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = _now_ms()
+        if not cache.add(_version_key(user_id), version, VERSION_TIMEOUT):
+            version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def bump_user_versions(*user_ids):
+    """Mark everything the given users can see as changed."""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return
+    keys = [_version_key(user_id) for user_id in user_ids]
+    current = cache.get_many(keys)
+    now = _now_ms()
+    for key in keys:
+        # incr keeps versions strictly increasing and distinct even when two
+        # workers bump the same user in the same millisecond.
+        if key in current:
+            try:
+                cache.incr(key, max(1, now - current[key]))
+                continue
+            except ValueError:
+                pass  # Expired since the read; seed it below.
+        if not cache.add(key, now, VERSION_TIMEOUT):
+            cache.incr(key)
@@ -1,21 +1,49 @@
 import json
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import AuthenticationForm
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils import timezone
-from datetime import datetime, timedelta
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import condition, require_POST
+from datetime import datetime, timedelta, timezone as dt_timezone
 import logging
-import random
 from django.contrib import messages
-from django.http import HttpResponseRedirect, JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.safestring import mark_safe
 from django.contrib.auth.models import User
 from .forms import MechanicProfileForm, UserSignUpForm, MechanicSignUpForm, ServiceRequestForm, PaymentMethodForm
-from .models import UserProfile, ServiceRequest, Job, Invoice, PaymentMethod
+from django.db import transaction
+from django.db.models import Q
+from .models import UserProfile, ServiceRequest, Job, Invoice, PaymentMethod, JobTrack
+from .tracking import get_last_positions, ping_filter, schedule_track_compaction, notify_jobs_changed
+from .polyline import to_google_polyline
+from .geoindex import mechanic_position, nearby_requests
+from .geocoding import schedule_geocoding
+from .feed import feed_specializations, request_payload
+from .dispatch import claim_service_request, NoJobForRequest, ScheduleConflict
+from .versions import user_version
+from .fragments import fragment_cache
+from .pagination import InvalidCursor, keyset_page
+from .ics import feed_token, feed_user_id, mechanic_feed, rotate_feed_key
+from . import otp as otp_store
+from .customer_events import publish_customer_event
+from .ratelimit import rate_limit, rate_limiter
+from .stats import ACTIVE_BOOKING_STATUSES, get_user_stats
+from .scheduling import ACTIVE_JOB_STATUSES, DEFAULT_JOB_DURATION, available_mechanics, free_slots, schedule_index, ensure_schedule
 
 logger = logging.getLogger(__name__)
 
+REQUEST_BOARD_PAGE_SIZE = getattr(settings, 'REQUEST_BOARD_PAGE_SIZE', 20)
+
+# Widest range calendar_events serves (FullCalendar's month view asks for six
+# weeks).
+CALENDAR_MAX_RANGE = timedelta(days=62)
+
+@rate_limit('signup')
 def signup(request):
     if request.method == 'POST':
         form = UserSignUpForm(request.POST)
@@ -30,6 +58,7 @@ def signup(request):
         form = UserSignUpForm()
     return render(request, 'Authentication/signup.html', {'form': form, 'is_mechanic_signup': False})
 
+@rate_limit('signup')
 def mechanic_signup(request):
     if request.method == 'POST':
         form = MechanicSignUpForm(request.POST)
@@ -44,6 +73,7 @@ def mechanic_signup(request):
         form = MechanicSignUpForm()
     return render(request, 'Authentication/signup.html', {'form': form, 'is_mechanic_signup': True})
 
+@rate_limit('login')
 def login_view(request):
     if request.method == 'POST':
         form = AuthenticationForm(request, data=request.POST)
@@ -109,42 +139,45 @@ def mechanic_dashboard(request):
     if not request.user.profile.is_mechanic:
         return redirect('home')
 
-    # Query 1: New requests for ANY mechanic to accept.
-    new_requests_query = ServiceRequest.objects.filter(
-        mechanic=None, status='pending'
-    ).select_related('customer').order_by('-created_at')
-
-    # Query 2: Jobs ASSIGNED TO THIS MECHANIC that are active (scheduled or in progress).
-    # This is the list that will correctly show "Start" or "Complete".
-    my_active_jobs = Job.objects.filter(
-        mechanic=request.user,
-        status__in=['scheduled', 'in_progress']
-    ).select_related(
-        'service_request', 
-        'service_request__customer'
-    ).order_by('start_time')
+    # Query 1: New requests for ANY mechanic to accept. Only the newest page;
+    # the rest of the backlog is on the request board.
+    new_requests, more_requests = request_board_page(request.user, page_size=REQUEST_BOARD_PAGE_SIZE)
 
-    # Stats cards data
-    completed_jobs_count = Job.objects.filter(
-        mechanic=request.user, status='completed'
-    ).count()
-    ratings = Job.objects.filter(
-        mechanic=request.user, status='completed', rating__isnull=False
-    ).values_list('rating', flat=True)
-    average_rating = round(sum(ratings) / len(ratings), 1) if ratings else 0.0
-    
-    # We will get "Today's Appointments" count from the my_active_jobs query
     today = timezone.now().date()
-    todays_appointments_count = sum(1 for job in my_active_jobs if job.start_time.date() == today)
 
+    def render_active_jobs():
+        # Query 2: Jobs ASSIGNED TO THIS MECHANIC that are active (scheduled or in progress).
+        # This is the list that will correctly show "Start" or "Complete".
+        my_active_jobs = Job.objects.filter(
+            mechanic=request.user,
+            status__in=['scheduled', 'in_progress']
+        ).select_related(
+            'service_request', 
+            'service_request__customer'
+        ).order_by('start_time')
+
+        return {
+            'html': render_to_string('Mechanic/active_jobs_list.html', {'my_active_jobs': my_active_jobs}),
+            # We will get "Today's Appointments" count from the my_active_jobs query
+            'todays_appointments_count': sum(1 for job in my_active_jobs if job.start_time.date() == today),
+        }
+
+    # The date is part of the key so "today" rolls over without a write.
+    active_jobs = fragment_cache.get_or_render(
+        'mechanic_active_jobs', request.user.id, render_active_jobs, vary_on=(today,)
+    )
+
+    # Stats cards data
+    stats = get_user_stats(request.user)
 
     context = {
-        'new_requests_count': new_requests_query.count(),
-        'completed_jobs': completed_jobs_count,
-        'average_rating': average_rating,
-        'todays_appointments_count': todays_appointments_count,
-        'new_service_requests': new_requests_query,  # For the "Accept" list
-        'my_active_jobs': my_active_jobs,            # For the "Start/Complete" list
+        'new_requests_count': len(new_requests),
+        'more_requests': more_requests is not None,
+        'completed_jobs': stats.completed_count,
+        'average_rating': stats.average_rating,
+        'todays_appointments_count': active_jobs['todays_appointments_count'],
+        'new_service_requests': new_requests,  # For the "Accept" list
+        'active_jobs_html': mark_safe(active_jobs['html']),  # For the "Start/Complete" list
     }
     return render(request, 'Mechanic/mechanic_dashboard.html', context)
 
@@ -155,28 +188,22 @@ def accept_service_request(request, request_id):
         return redirect('home')
     if request.method == 'POST':
         try:
-            service_request = ServiceRequest.objects.get(id=request_id, mechanic=None, status='pending')
-            job = Job.objects.filter(service_request=service_request).first()
-
-            if not job:
-                # This case shouldn't happen with the current book_service logic, but it's a good safeguard
-                messages.error(request, "Cannot accept request: Corresponding job not found.")
-                return redirect('mechanic_dashboard')
-
-            service_request.mechanic = request.user
-            service_request.status = 'accepted'
-            
-            job.mechanic = request.user
-            job.status = 'scheduled'
-
-            service_request.save()
-            job.save()
-
-            messages.success(request, f"Service request for {service_request.customer.get_full_name()} has been accepted.")
+            claimed = claim_service_request(request_id, request.user)
+        except NoJobForRequest:
+            # This case shouldn't happen with the current book_service logic, but it's a good safeguard
+            messages.error(request, "Cannot accept request: Corresponding job not found.")
             return redirect('mechanic_dashboard')
-        except ServiceRequest.DoesNotExist:
+        except ScheduleConflict:
+            messages.error(request, "Cannot accept request: it overlaps a job you have already accepted.")
+            return redirect('mechanic_dashboard')
+
+        if not claimed:
             messages.error(request, "Service request not found or already assigned.")
             return redirect('mechanic_dashboard')
+
+        customer = User.objects.filter(service_requests__id=request_id).first()
+        messages.success(request, f"Service request for {customer.get_full_name()} has been accepted.")
+        return redirect('mechanic_dashboard')
     return redirect('mechanic_dashboard')
 
 
@@ -203,6 +230,7 @@ def complete_job_otp(request, service_request_id):
     return render(request, 'Mechanic/otp_verification.html', context)
 
 @login_required
+@rate_limit('verify_otp')
 def verify_otp(request, service_request_id):
     """Handles both sending and verifying the OTP via POST request."""
     if not request.user.profile.is_mechanic:
@@ -222,49 +250,50 @@ def verify_otp(request, service_request_id):
     }
 
     # --- Send OTP Logic ---
-    if 'send_otp' in request.POST:
-        otp = ''.join([str(random.randint(0, 9)) for _ in range(6)])
-        action_char = 'S' if action == 'start' else 'C'
-        
-        service_request.otp = f"{otp}-{action_char}"
-        service_request.otp_created_at = timezone.now()
-        service_request.save()
-        
-        logger.info(f"Generated OTP {otp} for service request {service_request_id} (action: {action})")
+    if action not in ('start', 'complete'):
+        messages.error(request, "Unknown action.")
+
+    elif 'send_otp' in request.POST:
+        otp_store.issue_otp(service_request, action)
+        # Versions are bumped by now, so the customer's refetch sees the code.
+        publish_customer_event(service_request.customer_id, 'otp_issued', request_id=service_request.id, action=action)
+
+        logger.info(f"Generated OTP for service request {service_request_id} (action: {action})")
         messages.success(request, f"OTP has been generated and is now visible to the customer.")
         context_for_render['otp_sent'] = True # To show a success message in template
 
     # --- Verify OTP Logic ---
     elif 'verify_otp' in request.POST:
-        entered_otp = request.POST.get('otp')
-        
-        if not service_request.otp or not service_request.otp_created_at:
-            messages.error(request, "No valid OTP found. Please generate a new one.")
-        elif (timezone.now() - service_request.otp_created_at).total_seconds() > 300: # 5 minutes expiry
-            messages.error(request, "OTP has expired. Please generate a new one.")
-        elif entered_otp == service_request.otp.split('-')[0]:
-            otp_action_char = service_request.otp.split('-')[1]
-            
-            # Check if the OTP action matches the form action
-            if (action == 'start' and otp_action_char == 'S') or (action == 'complete' and otp_action_char == 'C'):
+        entered_otp = (request.POST.get('otp') or '').strip()
+
+        with transaction.atomic():
+            # Consumed in the same transaction as the job update, so a failed
+            # save leaves the code usable.
+            result = otp_store.verify_and_consume(service_request, entered_otp, action)
+            if result == otp_store.VERIFIED:
                 if action == 'start':
                     job.status = 'in_progress'
-                    messages.success(request, "Job started successfully.")
                 else: # complete
                     job.status = 'completed'
                     job.completed_at = timezone.now()
-                    messages.success(request, "Job completed successfully.")
-                
+                # Stats counters are adjusted by the Job signals in the same transaction.
                 job.save()
-                
-                # Clear OTP after use
-                service_request.otp = None
-                service_request.otp_created_at = None
-                service_request.save()
-                
-                return redirect('mechanic_dashboard')
-            else:
-                messages.error(request, "This OTP is for a different action. Please use the correct OTP.")
+
+        if result == otp_store.VERIFIED:
+            messages.success(request, "Job started successfully." if action == 'start' else "Job completed successfully.")
+            notify_jobs_changed(job.mechanic_id)
+            publish_customer_event(service_request.customer_id, 'otp_consumed', request_id=service_request.id, action=action)
+
+            if job.status == 'completed':
+                schedule_track_compaction(job)
+
+            return redirect('mechanic_dashboard')
+        elif result == otp_store.NO_OTP:
+            messages.error(request, "No valid OTP found or it has expired. Please generate a new one.")
+        elif result == otp_store.WRONG_ACTION:
+            messages.error(request, "This OTP is for a different action. Please use the correct OTP.")
+        elif result == otp_store.TOO_MANY_ATTEMPTS:
+            messages.error(request, "Too many incorrect attempts. Please generate a new OTP.")
         else:
             messages.error(request, "Invalid OTP. Please try again.")
 
@@ -274,13 +303,87 @@ def verify_otp(request, service_request_id):
 def service_requests(request):
     if not request.user.profile.is_mechanic:
         return redirect('home')
-    return render(request, 'Mechanic/service_requests.html')
+
+    filters = request_board_filters(request)
+    try:
+        board_requests, next_cursor = request_board_page(
+            request.user, cursor=request.GET.get('cursor'), page_size=REQUEST_BOARD_PAGE_SIZE, **filters
+        )
+    except InvalidCursor:
+        return redirect('service_requests')
+
+    specializations = feed_specializations(request.user.profile.specialization)
+    context = {
+        'board_requests': board_requests,
+        'next_cursor': next_cursor,
+        'filters': filters,
+        'specialization_choices': [
+            (value, label) for value, label in UserProfile.SPECIALIZATION_CHOICES if value in specializations
+        ],
+    }
+    return render(request, 'Mechanic/service_requests.html', context)
 
 @login_required
-def service_calendar(request):
+def service_requests_page(request):
+    """One page of the request board as JSON, for infinite scroll."""
     if not request.user.profile.is_mechanic:
-        return redirect('home')
-    return render(request, 'Mechanic/service_calendar.html')
+        return JsonResponse({'success': False, 'message': 'Mechanics only'}, status=403)
+
+    try:
+        board_requests, next_cursor = request_board_page(
+            request.user, cursor=request.GET.get('cursor'), page_size=REQUEST_BOARD_PAGE_SIZE,
+            **request_board_filters(request)
+        )
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'message': 'Invalid cursor'}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'requests': [
+            {
+                **request_payload(service_request),
+                'distance_km': service_request.distance_km,
+                'html': render_to_string('Mechanic/request_card.html', {'request': service_request}, request=request),
+            }
+            for service_request in board_requests
+        ],
+        'next_cursor': next_cursor,
+    })
+
+def request_board_filters(request):
+    """The board's filters from the query string; blanks mean "any"."""
+    return {
+        'specialization': request.GET.get('specialization') or None,
+        'vehicle_type': request.GET.get('vehicle_type', '').strip() or None,
+    }
+
+def request_board_page(mechanic, cursor=None, page_size=20, specialization=None, vehicle_type=None):
+    """
+    Pending requests the mechanic can take, newest first, one keyset page at a
+    time. Returns (requests, next_cursor); each request carries distance_km.
+    """
+    # Same selection as the live feed the dashboard subscribes to.
+    specializations = feed_specializations(mechanic.profile.specialization)
+    if specialization:
+        specializations = [spec for spec in specializations if spec == specialization]
+    query = ServiceRequest.objects.filter(
+        mechanic=None, status='pending', specialization__in=specializations
+    ).select_related('customer')
+    if vehicle_type:
+        query = query.filter(vehicle_type=vehicle_type)
+
+    # Mechanics with a known position only see requests near them (plus any
+    # that haven't been geocoded yet), looked up in the in-process grid index.
+    request_distances = {}
+    origin = mechanic_position(mechanic)
+    if origin:
+        request_distances = nearby_requests(*origin)
+        query = query.filter(Q(id__in=list(request_distances)) | Q(latitude__isnull=True))
+
+    board_requests, next_cursor = keyset_page(query, cursor, page_size)
+    for service_request in board_requests:
+        service_request.distance_km = request_distances.get(service_request.id)
+    return board_requests, next_cursor
 
 @login_required
 def job_history(request):
@@ -319,51 +422,45 @@ def customer_dashboard(request):
     if request.user.profile.is_mechanic:
         return redirect('home')
 
-    active_bookings_count = Job.objects.filter(
-        service_request__customer=request.user,
-        status__in=['pending', 'scheduled', 'in_progress']
-    ).count()
-    
-    completed_services_count = Job.objects.filter(
-        service_request__customer=request.user, status='completed'
-    ).count()
-    
-    ratings = Job.objects.filter(
-        service_request__customer=request.user, status='completed', rating__isnull=False
-    ).values_list('rating', flat=True)
-    
-    average_rating = round(sum(ratings) / len(ratings), 1) if ratings else 0.0
-    
-    next_appointment_job = Job.objects.filter(
-        service_request__customer=request.user,
-        status__in=['pending', 'scheduled'],
-        start_time__gte=timezone.now()
-    ).order_by('start_time').first()
-    
-    current_bookings = Job.objects.filter(
-        service_request__customer=request.user,
-        status__in=['pending', 'scheduled', 'in_progress']
-    ).select_related('service_request', 'mechanic', 'mechanic__profile').order_by('start_time')
-    
-    # REFACTOR: Get OTPs from the model, not the session.
-    otp_mapping = {}
-    for job in current_bookings:
-        sr = job.service_request
-        if sr.otp and sr.otp_created_at and (timezone.now() - sr.otp_created_at).total_seconds() < 300:
-            otp_code, action_char = sr.otp.split('-')
-            action_text = 'start' if action_char == 'S' else 'complete'
-            otp_mapping[sr.id] = {
-                'otp': otp_code,
-                'action': action_text
-            }
+    # Read before the queries so the client can't miss a change made meanwhile.
+    bookings_version = user_version(request.user.id)
+
+    stats = get_user_stats(request.user)
+
+    def render_bookings():
+        current_bookings = Job.objects.filter(
+            service_request__customer=request.user,
+            status__in=ACTIVE_BOOKING_STATUSES
+        ).select_related('service_request', 'mechanic', 'mechanic__profile').order_by('start_time')
+
+        # All of the bookings' live OTPs in one lookup.
+        otp_mapping = otp_store.active_otps(job.service_request_id for job in current_bookings)
+
+        return {
+            'html': render_to_string('Customer/booking_list.html', {
+                'current_bookings': current_bookings,
+                'otp_mapping': otp_mapping,
+            }),
+            'job_ids': [job.id for job in current_bookings],
+            'expires_at': min((otp['expires_at'] for otp in otp_mapping.values()), default=None),
+        }
+
+    bookings = fragment_cache.get_or_render('customer_bookings', request.user.id, render_bookings)
+
+    # Live ETA comes from the tracking cache, so it costs no extra query.
+    live_etas = {}
+    for job_id, position in get_last_positions(bookings['job_ids']).items():
+        if position.get('eta_seconds') is not None:
+            live_etas[job_id] = max(1, round(position['eta_seconds'] / 60))
 
     context = {
-        'active_bookings': active_bookings_count,
-        'completed_services': completed_services_count,
-        'average_rating': average_rating,
-        'next_appointment': next_appointment_job.start_time if next_appointment_job else None,
-        'current_bookings': current_bookings,
-        'otp_mapping': otp_mapping,
+        'active_bookings': stats.active_count,
+        'completed_services': stats.completed_count,
+        'average_rating': stats.average_rating,
+        'next_appointment': stats.next_appointment,
+        'bookings_html': mark_safe(bookings['html']),
+        'live_etas': live_etas,
+        'bookings_version': bookings_version,
     }
     
     # Handle AJAX requests for polling
@@ -372,52 +469,111 @@ def customer_dashboard(request):
         
     return render(request, 'Customer/customer_dashboard.html', context)
 
+@login_required
+def customer_bookings(request):
+    """
+    Changes to the customer's current bookings since ?since=<version>, for the
+    dashboard poll. Answers 304 from a single cache read when nothing changed.
+    Each changed booking comes with its freshly rendered card.
+    """
+    version = user_version(request.user.id)
+    etag = f'"{version}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    if request.user.profile.is_mechanic:
+        return JsonResponse({'success': False, 'message': 'Customers only'}, status=403)
+
+    jobs = Job.objects.filter(service_request__customer=request.user)
+    since = request.GET.get('since', '')
+    # Versions are millisecond timestamps; anything longer can't be one.
+    if since.isdigit() and len(since) <= 13:
+        # A little overlap covers writes committed just after the version the
+        # client saw was read; re-sending a card is harmless.
+        since_at = datetime.fromtimestamp(int(since) / 1000, tz=dt_timezone.utc) - timedelta(seconds=5)
+        jobs = jobs.filter(Q(updated_at__gt=since_at) | Q(service_request__updated_at__gt=since_at))
+    else:
+        jobs = jobs.filter(status__in=ACTIVE_BOOKING_STATUSES)
+    jobs = jobs.select_related('service_request', 'mechanic', 'mechanic__profile').order_by('start_time')
+
+    last_positions = get_last_positions([job.id for job in jobs])
+    otps = otp_store.active_otps(job.service_request_id for job in jobs if job.status in ACTIVE_BOOKING_STATUSES)
+    bookings = []
+    for job in jobs:
+        active = job.status in ACTIVE_BOOKING_STATUSES
+        booking = {'id': job.id, 'status': job.status, 'active': active}
+        if active:
+            eta_seconds = last_positions.get(job.id, {}).get('eta_seconds')
+            job.eta_minutes = max(1, round(eta_seconds / 60)) if eta_seconds is not None else None
+            otp_data = otps.get(job.service_request_id)
+            booking.update({
+                'start_time': job.start_time.isoformat(),
+                'otp': {**otp_data, 'expires_at': otp_data['expires_at'].isoformat()} if otp_data else None,
+                'html': render_to_string('Customer/booking_card.html', {'booking': job, 'otp_data': otp_data}),
+            })
+        bookings.append(booking)
+
+    response = JsonResponse({'success': True, 'version': version, 'bookings': bookings})
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
 @login_required
 def track_service(request):
     logger.info(f"Accessing track_service for user {request.user.username}")
     
     is_mechanic = request.user.profile.is_mechanic
     
-    active_jobs_query = Job.objects.none() # Start with an empty queryset
+    def render_active_jobs():
+        active_jobs_query = Job.objects.none() # Start with an empty queryset
 
-    if is_mechanic:
-        active_jobs_query = Job.objects.filter(
-            mechanic=request.user,
-            status__in=['scheduled', 'in_progress', 'en_route']
-        )
-    else:  # Customer
-        active_jobs_query = Job.objects.filter(
-            service_request__customer=request.user,
-            status__in=['scheduled', 'in_progress', 'en_route']
-        )
-    
-    active_jobs = active_jobs_query.select_related(
-        'service_request', 
-        'mechanic', 
-        'mechanic__profile'
-    ).order_by('start_time')
-    
-    # --- SOLUTION: Attach OTP data directly to each job object ---
-    for job in active_jobs:
-        job.otp_data = None  # Default to None
-        sr = job.service_request
-        if sr.otp and sr.otp_created_at and (timezone.now() - sr.otp_created_at).total_seconds() < 300:
-            try:
-                otp_code, action_char = sr.otp.split('-')
-                action_text = 'start' if action_char == 'S' else 'complete'
-                job.otp_data = {
-                    'otp': otp_code,
-                    'action': action_text
-                }
-            except ValueError:
-                # Handle case where OTP format is incorrect
-                logger.warning(f"Malformed OTP '{sr.otp}' found for ServiceRequest {sr.id}")
+        if is_mechanic:
+            active_jobs_query = Job.objects.filter(
+                mechanic=request.user,
+                status__in=['scheduled', 'in_progress', 'en_route']
+            )
+        else:  # Customer
+            active_jobs_query = Job.objects.filter(
+                service_request__customer=request.user,
+                status__in=['scheduled', 'in_progress', 'en_route']
+            )
+
+        active_jobs = active_jobs_query.select_related(
+            'service_request', 
+            'mechanic', 
+            'mechanic__profile'
+        ).order_by('start_time')
+
+        # --- SOLUTION: Attach OTP data directly to each job object ---
+        otps = otp_store.active_otps(job.service_request_id for job in active_jobs)
+        for job in active_jobs:
+            job.otp_data = otps.get(job.service_request_id)
+
+        return {
+            'html': render_to_string('Customer/track_jobs_list.html', {
+                'active_jobs': active_jobs,
+                'is_mechanic': is_mechanic,
+            }),
+            'job_ids': [job.id for job in active_jobs],
+            'expires_at': min((job.otp_data['expires_at'] for job in active_jobs if job.otp_data), default=None),
+        }
+
+    active_jobs = fragment_cache.get_or_render(
+        'track_active_jobs', request.user.id, render_active_jobs, vary_on=(is_mechanic,)
+    )
+
+    # Seed each map with the mechanic's last known position (cache only, no DB read).
+    live_positions = {}
+    for job_id, position in get_last_positions(active_jobs['job_ids']).items():
+        live_positions[job_id] = {'latitude': position['latitude'], 'longitude': position['longitude']}
+        if position.get('eta_seconds') is not None:
+            live_positions[job_id]['eta_minutes'] = max(1, round(position['eta_seconds'] / 60))
 
-        # You can also attach the mechanic's address here if you have a location model
-        # For now, we'll assume the template handles this part.
-        
     context = {
-        'active_jobs': active_jobs,
+        'active_jobs_html': mark_safe(active_jobs['html']),
+        'live_positions': live_positions,
         'is_mechanic': is_mechanic,
     }
     return render(request, 'Customer/track_service.html', context)
@@ -431,6 +587,7 @@ def rate_service(request):
     return render(request, 'Customer/rate_service.html')
 
 @login_required
+@rate_limit('book_service')
 def book_service(request):
     if request.user.profile.is_mechanic:
         return redirect('home')
@@ -448,11 +605,14 @@ def book_service(request):
             service_request.customer = request.user
             service_request.preferred_datetime = preferred_datetime
             service_request.save()
+            # Announced on the mechanics' feed once geocoded, so it only
+            # reaches mechanics within range.
+            schedule_geocoding(service_request, publish=True)
             
             Job.objects.create(
                 service_request=service_request,
                 start_time=preferred_datetime,
-                end_time=preferred_datetime + timedelta(hours=2), # Default duration
+                end_time=preferred_datetime + DEFAULT_JOB_DURATION,
                 status='pending'
             )
             
@@ -464,6 +624,8 @@ def book_service(request):
                 status='pending'
             )
 
+            if not available_mechanics(preferred_datetime, preferred_datetime + DEFAULT_JOB_DURATION, service_request.specialization):
+                messages.warning(request, "No mechanic is free at your preferred time yet; it may take longer to confirm.")
             messages.success(request, "Your service has been booked successfully!")
             return redirect('booking_confirmation', booking_id=service_request.id)
         else:
@@ -471,7 +633,10 @@ def book_service(request):
     else:
         form = ServiceRequestForm()
     
-    context = {'form': form}
+    context = {
+        'form': form,
+        'free_slots': free_slots(timezone.localdate(), specialization=form['specialization'].value()),
+    }
     return render(request, 'Customer/book_service.html', context)
 
 @login_required
@@ -624,7 +789,8 @@ def rate_service(request):
             )
             job_to_rate.rating = float(rating)
             job_to_rate.comments = comments
-            job_to_rate.save()
+            with transaction.atomic():
+                job_to_rate.save()
             
             logger.info(f"User {request.user.username} submitted rating {rating} for job {job_id}")
             messages.success(request, f"Thank you for your feedback on the '{job_to_rate.service_request.issue_description[:30]}...' service!")
@@ -667,6 +833,7 @@ def stop_location_sharing(request):
             job = Job.objects.get(id=job_id, mechanic=request.user, status='en_route')
             job.status = 'in_progress'
             job.save()
+            notify_jobs_changed(request.user.id)
             return JsonResponse({'success': True})
         except Job.DoesNotExist:
             return JsonResponse({'success': False, 'message': 'Job not found or not authorized'})
@@ -681,17 +848,198 @@ def service_calendar(request):
         logger.warning(f"Unauthorized access to service_calendar by {request.user.username}")
         return redirect('home')
 
-    my_active_jobs = Job.objects.filter(
+    # Events are fetched per visible range from calendar_events.
+    feed_url = request.build_absolute_uri(reverse('calendar_feed', args=[feed_token(request.user.profile)]))
+    return render(request, 'Mechanic/service_calendar.html', {
+        'feed_url': feed_url,
+        'webcal_url': 'webcal://' + feed_url.split('://', 1)[1],
+    })
+
+@login_required
+@require_POST
+def reset_calendar_feed(request):
+    """Issue a new calendar feed link; subscriptions to the old one stop working."""
+    if not request.user.profile.is_mechanic:
+        return redirect('home')
+    rotate_feed_key(request.user.profile)
+    logger.info(f"Calendar feed link reset by {request.user.username}")
+    messages.success(request, "Your calendar link has been reset. Subscribe again with the new link.")
+    return redirect('service_calendar')
+
+def _feed_etag(request, token):
+    user_id = feed_user_id(token)
+    return str(user_version(user_id)) if user_id else None
+
+def _feed_last_modified(request, token):
+    user_id = feed_user_id(token)
+    if not user_id:
+        return None
+    return datetime.fromtimestamp(user_version(user_id) / 1000, tz=dt_timezone.utc)
+
+@condition(etag_func=_feed_etag, last_modified_func=_feed_last_modified)
+def calendar_feed(request, token):
+    """
+    A mechanic's jobs as an iCalendar subscription. The signed token in the URL
+    stands in for a login, so the session is never loaded, and unchanged
+    calendars are answered with 304 from cache reads alone. Revoked links and
+    deactivated mechanics get 404.
+    """
+    user_id = feed_user_id(token)
+    if not user_id:
+        raise Http404("Unknown calendar feed")
+
+    response = StreamingHttpResponse(mechanic_feed(user_id, request.get_host()), content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'inline; filename="mechongo-jobs.ics"'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _calendar_etag(request):
+    return str(user_version(request.user.id))
+
+def _calendar_last_modified(request):
+    return datetime.fromtimestamp(user_version(request.user.id) / 1000, tz=dt_timezone.utc)
+
+def _parse_calendar_bound(value):
+    """FullCalendar sends ISO datetimes, or bare dates; naive values are UTC."""
+    try:
+        parsed = parse_datetime(value or '')
+        if parsed is None:
+            parsed_date = parse_date(value or '')
+            if parsed_date is None:
+                return None
+            parsed = datetime.combine(parsed_date, datetime.min.time())
+    except ValueError:
+        # Well-formed but impossible, e.g. 2024-02-30.
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+@login_required
+@condition(etag_func=_calendar_etag, last_modified_func=_calendar_last_modified)
+def calendar_events(request):
+    """
+    The mechanic's jobs overlapping [start, end) as compact JSON for the
+    service calendar. ?include_completed=1 adds finished jobs. Conditional
+    GETs are answered with 304 from the mechanic's version alone.
+    """
+    if not request.user.profile.is_mechanic:
+        return JsonResponse({'success': False, 'message': 'Mechanics only'}, status=403)
+
+    start = _parse_calendar_bound(request.GET.get('start'))
+    end = _parse_calendar_bound(request.GET.get('end'))
+    if start is None or end is None or end <= start:
+        return JsonResponse({'success': False, 'message': 'start and end must be dates with start before end'}, status=400)
+    if end - start > CALENDAR_MAX_RANGE:
+        return JsonResponse({'success': False, 'message': f'Ranges are limited to {CALENDAR_MAX_RANGE.days} days'}, status=400)
+
+    statuses = list(ACTIVE_JOB_STATUSES)
+    if request.GET.get('include_completed') in ('1', 'true'):
+        statuses.append('completed')
+
+    # Both bounds on start_time keep the (mechanic, start_time) index scan to
+    # the window; no job runs longer than Job.MAX_DURATION, so none is missed.
+    jobs = Job.objects.filter(
         mechanic=request.user,
-        status__in=['scheduled', 'in_progress']
-    ).select_related(
-        'service_request', 
-        'service_request__customer'
-    ).order_by('start_time')
+        status__in=statuses,
+        start_time__lt=end,
+        start_time__gte=start - Job.MAX_DURATION,
+        end_time__gt=start,
+    ).order_by('start_time').values_list(
+        'id', 'status', 'start_time', 'end_time', 'service_request_id', 'service_request__issue_description',
+        'service_request__customer__first_name', 'service_request__customer__last_name',
+        'service_request__vehicle_make', 'service_request__vehicle_model', 'service_request__vehicle_year',
+    )
+
+    events = []
+    for job_id, status, start_time, end_time, request_id, issue, first_name, last_name, make, model, year in jobs:
+        events.append({
+            'id': job_id,
+            'status': status,
+            'start': start_time.isoformat(),
+            'end': end_time.isoformat(),
+            'request': request_id,
+            'issue': issue or '',
+            'customer': f"{first_name} {last_name}".strip(),
+            'vehicle': f"{make} {model} ({year})" if make and model and year else '',
+        })
 
-    logger.info(f"Rendering service calendar for {request.user.username} with {my_active_jobs.count()} active jobs")
-    return render(request, 'Mechanic/service_calendar.html', {
-        'my_active_jobs': my_active_jobs
+    response = JsonResponse({'success': True, 'events': events})
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@login_required
+def job_track(request, job_id):
+    """Returns the compacted route of a completed job as an encoded polyline."""
+    jobs = Job.objects.all()
+    if not request.user.is_staff:
+        jobs = jobs.filter(Q(service_request__customer=request.user) | Q(mechanic=request.user))
+    job = get_object_or_404(jobs, id=job_id)
+
+    try:
+        track = job.track
+    except JobTrack.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'No track recorded for this job'}, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'job_id': job.id,
+        'polyline': to_google_polyline(track.points),
+        'point_count': track.point_count,
+        'raw_point_count': track.raw_point_count,
+        'started_at': track.started_at.isoformat() if track.started_at else None,
+        'ended_at': track.ended_at.isoformat() if track.ended_at else None,
+    })
+
+@login_required
+def availability(request):
+    """
+    Which mechanics are free between ?start= and ?end= (ISO 8601), optionally
+    only those who handle ?specialization=. With ?mechanic=<id> returns whether
+    that mechanic is free instead; the busy intervals themselves are only shown
+    to the mechanic and to staff.
+    """
+    try:
+        start = parse_datetime(request.GET.get('start', ''))
+        end = parse_datetime(request.GET.get('end', ''))
+    except ValueError:
+        # Well-formed but impossible, e.g. 2024-02-30.
+        start = end = None
+    if start is None or end is None or end <= start:
+        return JsonResponse({'success': False, 'message': 'start and end must be ISO 8601 datetimes with start < end'}, status=400)
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    if timezone.is_naive(end):
+        end = timezone.make_aware(end)
+
+    mechanic_id = request.GET.get('mechanic')
+    if mechanic_id:
+        if not mechanic_id.isdigit():
+            return JsonResponse({'success': False, 'message': 'Invalid mechanic'}, status=400)
+        mechanic_id = int(mechanic_id)
+        ensure_schedule()
+        busy = schedule_index.busy(mechanic_id, start, end)
+        data = {'success': True, 'mechanic_id': mechanic_id, 'free': not busy}
+        if mechanic_id == request.user.id or request.user.is_staff:
+            data['busy'] = [{'start': s.isoformat(), 'end': e.isoformat()} for s, e in busy]
+        return JsonResponse(data)
+
+    mechanic_ids = available_mechanics(start, end, request.GET.get('specialization'))
+    return JsonResponse({
+        'success': True,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'count': len(mechanic_ids),
+        'mechanic_ids': mechanic_ids,
+    })
+
+@user_passes_test(lambda u: u.is_staff)
+def metrics(request):
+    """Staff-only view of this worker process's in-memory counters."""
+    return JsonResponse({
+        'location_pings': ping_filter.stats(),
+        'fragment_cache': fragment_cache.stats(),
+        'rate_limits': rate_limiter.stats(),
     })
 
 def custom_404(request, exception):